@@ -1,10 +1,19 @@
 import os
 import sys
 import gc
+import json
+import math
 import time
+import queue
+import uuid
+import bisect
+import hashlib
 import psutil
 import logging
 import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import contextmanager
 from datetime import datetime
 from functools import wraps
 from io import BytesIO
@@ -13,10 +22,10 @@ import PIL
 import numpy
 from numpy import zeros, asarray, expand_dims
 import tensorflow as tf
+import keras
 from flask import Flask, request, jsonify, g
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
-import skimage.color
 
 # Load environment variables
 try:
@@ -27,7 +36,8 @@ except ImportError:
 
 # Import Mask R-CNN components
 from mrcnn.config import Config
-from mrcnn.model import MaskRCNN, mold_image
+from mrcnn.model import MaskRCNN, FrozenMaskRCNN
+from mrcnn.utils import resolve_resize_backend
 
 # Configure logging with smart defaults
 log_level = getattr(logging, os.getenv('LOG_LEVEL', 'INFO').upper(), logging.INFO)
@@ -61,25 +71,256 @@ class AppConfig:
     TESTING = False
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
     APP_LOG = 'app.log'
+    
+    # Serving layout: 'multiprocess' runs one model per Gunicorn worker; 'single'
+    # runs one process that owns the model on a dedicated inference thread and
+    # serves HTTP from a pool of HTTP_THREADS threads
+    SERVING_MODE = os.getenv('SERVING_MODE', 'multiprocess').lower()
+    HTTP_THREADS = int(os.getenv('HTTP_THREADS', 16))
+    WORKER_THREADS = int(os.getenv('WORKER_THREADS', 1))  # gthread threads per worker in multiprocess mode
+    
+    # TensorFlow thread pools per process. With TF_INTRA_OP_THREADS=0 the
+    # intra-op pool gets this process's share of the cores: the ones it is
+    # pinned to (with CPU_AFFINITY, gunicorn.conf.py gives every worker a
+    # disjoint set), otherwise the node's cores divided among the workers
+    TF_INTRA_OP_THREADS = int(os.getenv('TF_INTRA_OP_THREADS', 0))
+    TF_INTER_OP_THREADS = int(os.getenv('TF_INTER_OP_THREADS', 2))
+    
+    # Dynamic micro-batching: one model is built per batch size, and requests
+    # arriving within BATCH_WINDOW_MS are run through a single detect() call
+    BATCH_SIZES = sorted({int(size) for size in os.getenv('BATCH_SIZES', '1').split(',') if size.strip()})
+    BATCH_WINDOW_MS = float(os.getenv('BATCH_WINDOW_MS', 10))
+    
+    # Result cache for re-uploaded floor plans (memory LRU + optional disk tier)
+    RESULT_CACHE_MAX_ENTRIES = int(os.getenv('RESULT_CACHE_MAX_ENTRIES', 256))
+    RESULT_CACHE_MAX_BYTES = int(os.getenv('RESULT_CACHE_MAX_BYTES', 64 * 1024 * 1024))  # 64MB
+    RESULT_CACHE_DIR = os.getenv('RESULT_CACHE_DIR', '')  # Empty disables the disk tier
+    
+    # Asynchronous jobs (POST /jobs, GET /jobs/<id>)
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', 1))
+    JOB_QUEUE_MAX = int(os.getenv('JOB_QUEUE_MAX', 32))
+    JOB_RESULT_TTL = int(os.getenv('JOB_RESULT_TTL', 3600))  # 1 hour
+    JOB_DRAIN_SECONDS = int(os.getenv('JOB_DRAIN_SECONDS', 20))  # Keep below Gunicorn's graceful_timeout
+    JOBS_DIR = os.getenv('JOBS_DIR', './jobs')
+    
+    # Admission control: concurrent inferences per worker, how many requests
+    # may wait for a slot (and for how long), and the RSS above which new
+    # requests are shed. The default lets every HTTP thread of a worker in,
+    # and at least enough requests to fill the largest batch size.
+    MAX_INFLIGHT_REQUESTS = int(os.getenv('MAX_INFLIGHT_REQUESTS',
+                                          HTTP_THREADS if SERVING_MODE == 'single'
+                                          else max(WORKER_THREADS, max(BATCH_SIZES))))
+    MAX_WAITING_REQUESTS = int(os.getenv('MAX_WAITING_REQUESTS', 8))
+    ADMISSION_WAIT_TIMEOUT = float(os.getenv('ADMISSION_WAIT_TIMEOUT', 30))
+    MEMORY_LIMIT_MB = int(os.getenv('MEMORY_LIMIT_MB', 6144))  # 6GB, 0 disables
+    
+    # Background resource sampler: seconds between samples, how many samples
+    # /memory/history keeps, and how often the (slower) per-worker breakdown runs
+    MEMORY_SAMPLE_INTERVAL = float(os.getenv('MEMORY_SAMPLE_INTERVAL', 1.0))
+    MEMORY_HISTORY_SIZE = int(os.getenv('MEMORY_HISTORY_SIZE', 600))
+    WORKER_MEMORY_INTERVAL = float(os.getenv('WORKER_MEMORY_INTERVAL', 10.0))
+    
+    # Garbage collection policy: generational thresholds, full collections
+    # when idle / every GC_INTERVAL_SECONDS / above an RSS watermark, and
+    # gc.freeze() of everything alive once the model is loaded
+    GC_THRESHOLDS = tuple(int(t) for t in os.getenv('GC_THRESHOLDS', '50000,20,100').split(','))
+    GC_IDLE_SECONDS = float(os.getenv('GC_IDLE_SECONDS', 5))
+    GC_INTERVAL_SECONDS = float(os.getenv('GC_INTERVAL_SECONDS', 600))  # 0 disables
+    GC_RSS_WATERMARK_MB = int(os.getenv('GC_RSS_WATERMARK_MB', MEMORY_THRESHOLD_MB))  # 0 disables
+    GC_WATERMARK_COOLDOWN = float(os.getenv('GC_WATERMARK_COOLDOWN', 30))
+    GC_FREEZE = os.getenv('GC_FREEZE', 'true').lower() == 'true'
+    
+    # Decode oversize uploads straight to (about) the model's input size
+    FAST_DECODE = os.getenv('FAST_DECODE', 'true').lower() == 'true'
+    
+    # Tiled detection: images whose long side exceeds TILE_MIN_DIM are run in
+    # IMAGE_MAX_DIM tiles at native resolution (decoded up to TILE_MAX_DIM)
+    TILED_DETECTION = os.getenv('TILED_DETECTION', 'false').lower() == 'true'
+    TILE_MIN_DIM = int(os.getenv('TILE_MIN_DIM', 2048))
+    TILE_MAX_DIM = int(os.getenv('TILE_MAX_DIM', 8192))
+    
+    # Model input shapes (HxW, comma separated) whose anchors are built and
+    # which are warmed up at boot. Empty means every canvas of the resize
+    # mode. ANCHOR_CACHE_DIR keeps the anchors on disk between restarts.
+    WARMUP_SHAPES = [tuple(int(d) for d in shape.lower().split('x'))
+                     for shape in os.getenv('WARMUP_SHAPES', '').split(',') if shape.strip()]
+    ANCHOR_CACHE_DIR = os.getenv('ANCHOR_CACHE_DIR', '')
+    
+    # Serve frozen graphs written by export_model.py (one per batch size)
+    # instead of building the Keras model and loading the .h5 weights
+    FROZEN_GRAPH_DIR = os.getenv('FROZEN_GRAPH_DIR', '')
+    
+    # Named model variants served side by side, as comma separated
+    # 'name:backbone:weights file[:image max dim]' entries (weights files in
+    # WEIGHTS_FOLDER). Requests pick one with their `quality` parameter and
+    # get DEFAULT_VARIANT (or the first one) otherwise. Empty serves only
+    # WEIGHTS_FILE_NAME with the default backbone.
+    MODEL_VARIANTS = [tuple(part.strip() for part in entry.split(':'))
+                      for entry in os.getenv('MODEL_VARIANTS', '').split(',') if entry.strip()]
+    DEFAULT_VARIANT = os.getenv('DEFAULT_VARIANT', '')
+    
+    # PDF uploads: pages are rendered so their long side is IMAGE_MAX_DIM
+    PDF_MAX_PAGES = int(os.getenv('PDF_MAX_PAGES', 20))
 
 class PredictionConfig(Config):
     NAME = "floorPlan_cfg"
     NUM_CLASSES = 4  # 4 total classes (1 background + 3 object classes: door, wall, window)
     GPU_COUNT = 1
     IMAGES_PER_GPU = 1
+    DETECTION_MASKS = False  # The API only returns boxes, so skip the mask head
+    # Pad to the closest of a few aspect-ratio canvases instead of a full
+    # square, so wide plans don't spend half the backbone on padding
+    IMAGE_RESIZE_MODE = os.getenv('IMAGE_RESIZE_MODE', 'bucket')
+    # Reuse detect()'s input arrays; warm-up fills the pool for every shape
+    INPUT_BUFFER_POOL = os.getenv('INPUT_BUFFER_POOL', 'true').lower() == 'true'
+    # OpenCV/Pillow resize instead of Scikit-Image (see utils.resize())
+    RESIZE_BACKEND = os.getenv('RESIZE_BACKEND', 'auto')
+    # Fold the frozen BatchNorm layers into the convs (same detections, fewer ops)
+    FOLD_BATCH_NORM = os.getenv('FOLD_BATCH_NORM', 'true').lower() == 'true'
+
+def make_prediction_config(batch_size=1, variant=None):
+    """Create a PredictionConfig whose graph takes `batch_size` images,
+    with the backbone and input size of a ModelVariant if one is given"""
+    cfg = variant.config_class() if variant is not None else PredictionConfig()
+    cfg.IMAGES_PER_GPU = batch_size
+    cfg.BATCH_SIZE = batch_size * cfg.GPU_COUNT
+    return cfg
 
-# Global variables for model and monitoring
-_model = None
+# Global variables for model and monitoring (the models themselves live in
+# model_registry)
 _graph = None
-_cfg = None
 _model_loaded = False
+_model_ready = False  # Loaded and warmed up
+_model_load_seconds = None
+_warmup_seconds = None
+_tensorflow_threads = None  # Effective session thread settings, set by configure_tensorflow()
 _model_lock = threading.Lock()
 _request_count = 0
 _start_time = time.time()
 
+# Prometheus metrics (optional). Under Gunicorn, PROMETHEUS_MULTIPROC_DIR is
+# set by gunicorn.conf.py before this module is imported, so every worker
+# writes its samples there and a scrape of any worker sees the whole node.
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess as prometheus_multiprocess
+    from prometheus_client.exposition import choose_encoder
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    logger.warning("prometheus_client not installed. /metrics/prometheus is disabled.")
+    PROMETHEUS_AVAILABLE = False
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float('inf'))
+
+class PrometheusMetrics:
+    """Prometheus collectors for the API; every method is a no-op when
+    prometheus_client is not installed"""
+    
+    def __init__(self):
+        self.available = PROMETHEUS_AVAILABLE
+        if not self.available:
+            return
+        self.multiprocess = bool(os.getenv('PROMETHEUS_MULTIPROC_DIR') or os.getenv('prometheus_multiproc_dir'))
+        self.request_latency = prometheus_client.Histogram(
+            'floorplan_http_request_duration_seconds', 'HTTP request latency',
+            ['endpoint', 'method', 'status'], buckets=LATENCY_BUCKETS)
+        self.inference_latency = prometheus_client.Histogram(
+            'floorplan_inference_duration_seconds', 'Model forward pass time per batch',
+            ['variant', 'batch_size'], buckets=LATENCY_BUCKETS)
+        self.stage_latency = prometheus_client.Histogram(
+            'floorplan_stage_duration_seconds', 'Predict pipeline stage latency',
+            ['stage'], buckets=LATENCY_BUCKETS)
+        self.inflight = prometheus_client.Gauge(
+            'floorplan_inflight_requests', 'HTTP requests currently being handled',
+            multiprocess_mode='livesum')
+        self.queue_depth = prometheus_client.Gauge(
+            'floorplan_queue_depth', 'Items waiting in an internal queue',
+            ['queue'], multiprocess_mode='livesum')
+        self.shed = prometheus_client.Counter(
+            'floorplan_requests_shed_total', 'Requests rejected by admission control', ['reason'])
+        self.model_load = prometheus_client.Gauge(
+            'floorplan_model_load_seconds', 'Time taken to load the model',
+            multiprocess_mode='max')
+        self.model_warmup = prometheus_client.Gauge(
+            'floorplan_model_warmup_seconds', 'Time taken to warm up the model',
+            multiprocess_mode='max')
+        self.resident_memory = prometheus_client.Gauge(
+            'floorplan_process_resident_memory_bytes', 'Resident memory of each worker process',
+            multiprocess_mode='all')
+        self.gc_pause = prometheus_client.Histogram(
+            'floorplan_gc_pause_seconds', 'Garbage collector pause time',
+            ['generation'], buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+        self.gc_policy_collections = prometheus_client.Counter(
+            'floorplan_gc_policy_collections_total', 'Full collections triggered by the GC policy',
+            ['reason'])
+    
+    def observe_request(self, endpoint, method, status, seconds):
+        if self.available:
+            self.request_latency.labels(endpoint, method, str(status)).observe(seconds)
+    
+    def observe_inference(self, variant, batch_size, seconds):
+        if self.available:
+            self.inference_latency.labels(variant, str(batch_size)).observe(seconds)
+    
+    def observe_stages(self, durations):
+        if self.available:
+            for stage, seconds in durations.items():
+                self.stage_latency.labels(stage).observe(seconds)
+    
+    def track_inflight(self, delta):
+        if self.available:
+            self.inflight.inc(delta)
+    
+    def set_queue_depth(self, name, depth):
+        if self.available:
+            self.queue_depth.labels(name).set(depth)
+    
+    def record_shed(self, reason):
+        if self.available:
+            self.shed.labels(reason).inc()
+    
+    def set_model_times(self, load_seconds, warmup_seconds):
+        if self.available:
+            if load_seconds is not None:
+                self.model_load.set(load_seconds)
+            if warmup_seconds is not None:
+                self.model_warmup.set(warmup_seconds)
+    
+    def set_resident_memory(self, rss_bytes):
+        if self.available:
+            self.resident_memory.set(rss_bytes)
+    
+    def observe_gc_pause(self, generation, seconds):
+        if self.available:
+            self.gc_pause.labels(str(generation)).observe(seconds)
+    
+    def record_gc_collection(self, reason):
+        if self.available:
+            self.gc_policy_collections.labels(reason).inc()
+    
+    def render(self, accept_header):
+        """Return (body, content type) for a scrape, in OpenMetrics or the
+        Prometheus text format depending on the Accept header"""
+        if self.multiprocess:
+            registry = prometheus_client.CollectorRegistry()
+            prometheus_multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = prometheus_client.REGISTRY
+        encoder, content_type = choose_encoder(accept_header)
+        return encoder(registry), content_type
+
+prometheus_metrics = PrometheusMetrics()
+
 # Memory monitoring (fallback if psutil not available)
 class MemoryMonitor:
-    def __init__(self):
+    """Samples process and system resource usage on a background thread.
+    
+    Request handlers read the latest sample instead of calling psutil
+    themselves, and the last `history_size` samples are kept in a ring
+    buffer for /memory/history.
+    """
+    
+    def __init__(self, interval, history_size, worker_interval):
         try:
             import psutil
             self.process = psutil.Process()
@@ -88,31 +329,160 @@ class MemoryMonitor:
             logger.warning("psutil not available. Using basic memory monitoring.")
             self.psutil_available = False
         
+        self.interval = interval
+        self.worker_interval = worker_interval
+        self.history = deque(maxlen=history_size)
         self.peak_memory = 0
         self.current_memory = 0
-        
+        self.thread_stats = []
+        self.worker_memory = None
+        self._latest = None
+        self._above_threshold = False
+        self._thread_times = {}
+        self._last_worker_sample = 0.0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+    
     def update(self):
+        """Return the latest sample in the legacy stats format"""
+        sample = self.latest()
+        return {
+            'current_mb': sample['rss_mb'],
+            'peak_mb': sample['peak_mb'],
+            'cpu_percent': sample['cpu_percent'],
+            'memory_percent': sample['memory_percent']
+        }
+    
+    def latest(self):
+        """Most recent sample; takes one synchronously only before the first"""
+        self._ensure_running()
+        return self._latest if self._latest is not None else self.sample()
+    
+    def get_history(self, since=None):
+        samples = list(self.history)
+        if since is not None:
+            samples = [sample for sample in samples if sample['timestamp'] > since]
+        return samples
+    
+    def sample(self):
+        """Take a sample now, record it and return it"""
         if self.psutil_available:
             try:
-                memory_info = self.process.memory_info()
-                self.current_memory = memory_info.rss / 1024 / 1024  # MB
-                self.peak_memory = max(self.peak_memory, self.current_memory)
-                
-                # Log warning if memory usage is high
-                if self.current_memory > AppConfig.MEMORY_THRESHOLD_MB:
-                    logger.warning(f"High memory usage: {self.current_memory:.2f} MB")
-                    
-                return {
-                    'current_mb': round(self.current_memory, 2),
-                    'peak_mb': round(self.peak_memory, 2),
-                    'cpu_percent': self.process.cpu_percent(),
-                    'memory_percent': self.process.memory_percent()
-                }
+                sample = self._sample_psutil()
             except Exception as e:
                 logger.warning(f"Error getting memory stats: {e}")
-                return self._get_basic_stats()
+                sample = self._get_basic_stats()
         else:
-            return self._get_basic_stats()
+            sample = self._get_basic_stats()
+        
+        # Log once when memory usage crosses the threshold
+        above_threshold = self.current_memory > AppConfig.MEMORY_THRESHOLD_MB
+        if above_threshold and not self._above_threshold:
+            logger.warning(f"High memory usage: {self.current_memory:.2f} MB")
+        self._above_threshold = above_threshold
+        
+        with self._lock:
+            self.history.append(sample)
+            self._latest = sample
+        return sample
+    
+    def _ensure_running(self):
+        # Threads don't survive a fork, so (re)start the sampler per process
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                self._reset_process()
+            self._pid = os.getpid()
+            self._latest = None
+            self._thread_times = {}
+            self._thread = threading.Thread(target=self._run, name='memory-sampler', daemon=True)
+            self._thread.start()
+    
+    def _reset_process(self):
+        # With preload_app the monitor is created in the Gunicorn master, so a
+        # worker inherits the master's psutil handle, peak and history
+        if self.psutil_available:
+            self.process = psutil.Process()
+        self.history.clear()
+        self.peak_memory = 0
+        self.current_memory = 0
+        self.thread_stats = []
+        self.worker_memory = None
+        self._above_threshold = False
+        self._last_worker_sample = 0.0
+    
+    def _run(self):
+        while True:
+            try:
+                self.sample()
+                if self.psutil_available and time.time() - self._last_worker_sample >= self.worker_interval:
+                    self.worker_memory = worker_memory_report()
+                    self._last_worker_sample = time.time()
+            except Exception as e:
+                logger.warning(f"Memory sampler error: {e}")
+            time.sleep(self.interval)
+    
+    def _sample_psutil(self):
+        now = time.time()
+        with self.process.oneshot():
+            memory_info = self.process.memory_info()
+            cpu_percent = self.process.cpu_percent()
+            memory_percent = self.process.memory_percent()
+            threads = self.process.threads()
+        system_memory = psutil.virtual_memory()
+        swap = psutil.swap_memory()
+        
+        self.current_memory = memory_info.rss / 1024 / 1024  # MB
+        self.peak_memory = max(self.peak_memory, self.current_memory)
+        prometheus_metrics.set_resident_memory(memory_info.rss)
+        self._update_thread_stats(threads, now)
+        
+        return {
+            'timestamp': now,
+            'pid': self.process.pid,
+            'rss_mb': round(self.current_memory, 2),
+            'peak_mb': round(self.peak_memory, 2),
+            'memory_percent': round(memory_percent, 2),
+            'cpu_percent': cpu_percent,
+            'system_cpu_percent': psutil.cpu_percent(),
+            'system_memory_percent': system_memory.percent,
+            'system_total_mb': round(system_memory.total / 1024 / 1024, 2),
+            'system_used_mb': round(system_memory.used / 1024 / 1024, 2),
+            'system_available_mb': round(system_memory.available / 1024 / 1024, 2),
+            'swap_total_mb': round(swap.total / 1024 / 1024, 2),
+            'swap_used_mb': round(swap.used / 1024 / 1024, 2),
+            'swap_percent': swap.percent,
+            'num_threads': len(threads)
+        }
+    
+    def _update_thread_stats(self, threads, now):
+        """CPU usage of each thread since the previous sample"""
+        names = {t.native_id: t.name for t in threading.enumerate()
+                 if getattr(t, 'native_id', None) is not None}
+        previous = self._thread_times
+        self._thread_times = {}
+        stats = []
+        for thread in threads:
+            cpu_seconds = thread.user_time + thread.system_time
+            self._thread_times[thread.id] = (cpu_seconds, now)
+            if thread.id in previous:
+                last_seconds, last_time = previous[thread.id]
+                elapsed = now - last_time
+                cpu_percent = (cpu_seconds - last_seconds) / elapsed * 100 if elapsed > 0 else 0.0
+            else:
+                cpu_percent = 0.0
+            stats.append({
+                'id': thread.id,
+                'name': names.get(thread.id),
+                'cpu_seconds': round(cpu_seconds, 2),
+                'cpu_percent': round(cpu_percent, 1)
+            })
+        stats.sort(key=lambda stat: stat['cpu_percent'], reverse=True)
+        self.thread_stats = stats
     
     def _get_basic_stats(self):
         """Fallback memory stats when psutil is not available"""
@@ -128,22 +498,352 @@ class MemoryMonitor:
                 
             self.current_memory = memory_usage
             self.peak_memory = max(self.peak_memory, self.current_memory)
-            
-            return {
-                'current_mb': round(self.current_memory, 2),
-                'peak_mb': round(self.peak_memory, 2),
-                'cpu_percent': 0.0,  # Not available without psutil
-                'memory_percent': 0.0  # Not available without psutil
-            }
         except:
-            return {
-                'current_mb': 0.0,
-                'peak_mb': 0.0,
-                'cpu_percent': 0.0,
-                'memory_percent': 0.0
-            }
+            pass
+        
+        return {
+            'timestamp': time.time(),
+            'pid': os.getpid(),
+            'rss_mb': round(self.current_memory, 2),
+            'peak_mb': round(self.peak_memory, 2),
+            'memory_percent': 0.0,  # Not available without psutil
+            'cpu_percent': 0.0  # Not available without psutil
+        }
+
+memory_monitor = MemoryMonitor(AppConfig.MEMORY_SAMPLE_INTERVAL,
+                               AppConfig.MEMORY_HISTORY_SIZE,
+                               AppConfig.WORKER_MEMORY_INTERVAL)
+
+class GCPolicy:
+    """Decides when the cyclic garbage collector runs.
+    
+    Instead of a full collection after every request, the generational
+    thresholds are raised and full collections happen on a background thread
+    when the worker goes idle, every `interval` seconds, or when RSS crosses
+    `watermark_mb`. Pauses are timed through gc.callbacks.
+    """
+    
+    def __init__(self, thresholds, idle_seconds, interval, watermark_mb, watermark_cooldown):
+        self.thresholds = thresholds
+        self.idle_seconds = idle_seconds
+        self.interval = interval
+        self.watermark_mb = watermark_mb
+        self.watermark_cooldown = watermark_cooldown
+        self.collections = [0, 0, 0]
+        self.pause_total = [0.0, 0.0, 0.0]
+        self.pause_max = [0.0, 0.0, 0.0]
+        self.policy_collections = {'idle': 0, 'periodic': 0, 'watermark': 0}
+        self.frozen_objects = 0
+        self.active_requests = 0
+        self.requests_since_collect = 0
+        self.last_request = time.time()
+        self.last_collect = time.time()
+        self.last_watermark_collect = 0.0
+        self._pauses = deque(maxlen=10000)  # (generation, seconds) not yet exported
+        self._gc_start = None
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        
+        gc.set_threshold(*thresholds)
+        gc.callbacks.append(self._on_gc)
+    
+    def request_started(self):
+        self._ensure_running()
+        with self._lock:
+            self.active_requests += 1
+    
+    def request_finished(self):
+        with self._lock:
+            self.active_requests -= 1
+            self.requests_since_collect += 1
+            self.last_request = time.time()
+        if self.watermark_mb and memory_monitor.current_memory > self.watermark_mb:
+            self._wakeup.set()
+    
+    def freeze(self):
+        """Collect once, then move every surviving object (the model, its
+        graph and the imported modules) to the permanent generation so later
+        collections never rescan them. No-op before Python 3.7."""
+        gc.collect()
+        if hasattr(gc, 'freeze'):
+            gc.freeze()
+            self.frozen_objects = gc.get_freeze_count()
+            logger.info(f"Froze {self.frozen_objects} objects out of the garbage collector")
+    
+    def stats(self):
+        return {
+            'thresholds': list(gc.get_threshold()),
+            'counts': list(gc.get_count()),
+            'collections': list(self.collections),
+            'pause_total_ms': [round(t * 1000, 2) for t in self.pause_total],
+            'pause_max_ms': [round(t * 1000, 2) for t in self.pause_max],
+            'policy_collections': dict(self.policy_collections),
+            'frozen_objects': self.frozen_objects,
+            'watermark_mb': self.watermark_mb
+        }
+    
+    def _on_gc(self, phase, info):
+        # Runs inside the collector: no locks and no allocation-heavy work here
+        if phase == 'start':
+            self._gc_start = time.perf_counter()
+        elif self._gc_start is not None:
+            duration = time.perf_counter() - self._gc_start
+            generation = info['generation']
+            self.collections[generation] += 1
+            self.pause_total[generation] += duration
+            self.pause_max[generation] = max(self.pause_max[generation], duration)
+            self._pauses.append((generation, duration))
+            self._gc_start = None
+    
+    def _ensure_running(self):
+        # Threads don't survive a fork, so (re)start the policy thread per process
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='gc-policy', daemon=True)
+            self._thread.start()
+    
+    def _run(self):
+        while True:
+            self._wakeup.wait(timeout=1.0)
+            self._wakeup.clear()
+            try:
+                self._export_pauses()
+                reason = self._collection_due()
+                if reason is not None:
+                    self._collect(reason)
+            except Exception as e:
+                logger.warning(f"GC policy error: {e}")
+    
+    def _collection_due(self):
+        now = time.time()
+        if (self.watermark_mb and memory_monitor.current_memory > self.watermark_mb
+                and now - self.last_watermark_collect >= self.watermark_cooldown):
+            self.last_watermark_collect = now
+            return 'watermark'
+        if (self.active_requests == 0 and self.requests_since_collect > 0
+                and now - self.last_request >= self.idle_seconds):
+            return 'idle'
+        if self.interval and now - self.last_collect >= self.interval:
+            return 'periodic'
+        return None
+    
+    def _collect(self, reason):
+        start_time = time.perf_counter()
+        collected = gc.collect()
+        duration = time.perf_counter() - start_time
+        with self._lock:
+            self.requests_since_collect = 0
+            self.last_collect = time.time()
+            self.policy_collections[reason] += 1
+        prometheus_metrics.record_gc_collection(reason)
+        logger.debug(f"GC ({reason}) collected {collected} objects in {duration * 1000:.1f}ms")
+    
+    def _export_pauses(self):
+        while self._pauses:
+            generation, duration = self._pauses.popleft()
+            prometheus_metrics.observe_gc_pause(generation, duration)
+
+gc_policy = GCPolicy(AppConfig.GC_THRESHOLDS,
+                     AppConfig.GC_IDLE_SECONDS,
+                     AppConfig.GC_INTERVAL_SECONDS,
+                     AppConfig.GC_RSS_WATERMARK_MB,
+                     AppConfig.GC_WATERMARK_COOLDOWN)
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram with interpolated percentile estimates"""
+    
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+    
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+    
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if bucket_count and cumulative + bucket_count >= target:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i]
+                if upper == float('inf'):
+                    return lower
+                return lower + (upper - lower) * (target - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-2]
+    
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_ms': round(self.sum / self.count * 1000, 2) if self.count else 0.0,
+            'p50_ms': round(self.quantile(0.50) * 1000, 2),
+            'p95_ms': round(self.quantile(0.95) * 1000, 2),
+            'p99_ms': round(self.quantile(0.99) * 1000, 2)
+        }
+
+class StageTimings:
+    """Wall-clock durations of the pipeline stages of one request"""
+    
+    def __init__(self):
+        self.durations = OrderedDict()
+    
+    @contextmanager
+    def stage(self, name):
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, time.time() - start_time)
+    
+    def add(self, name, seconds):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+    
+    def update(self, durations):
+        for name, seconds in durations.items():
+            self.add(name, seconds)
+    
+    def as_ms(self):
+        return OrderedDict((name, round(seconds * 1000, 2)) for name, seconds in self.durations.items())
+
+class StageMetrics:
+    """Per-stage latency histograms aggregated over all requests"""
+    
+    def __init__(self):
+        self._histograms = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def record(self, timings):
+        with self._lock:
+            for stage, seconds in timings.durations.items():
+                if stage not in self._histograms:
+                    self._histograms[stage] = LatencyHistogram()
+                self._histograms[stage].observe(seconds)
+        prometheus_metrics.observe_stages(timings.durations)
+    
+    def summary(self):
+        with self._lock:
+            return OrderedDict((stage, histogram.summary())
+                               for stage, histogram in self._histograms.items())
+
+stage_metrics = StageMetrics()
+
+class ResultCache:
+    """LRU cache of prediction results keyed by image content and model fingerprint.
+    
+    Entries are bounded by count and by serialized size. When `cache_dir` is set,
+    results are also written there as JSON so they survive worker restarts and
+    are shared by all workers on the node.
+    """
+    
+    def __init__(self, max_entries, max_bytes, cache_dir=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir or None
+        self._entries = OrderedDict()  # key -> (result, size in bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+        
+        result = self._read_disk(key)
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._store(key, result, len(json.dumps(result)))
+        return result
+    
+    def put(self, key, result):
+        serialized = json.dumps(result)
+        with self._lock:
+            self._store(key, result, len(serialized))
+        self._write_disk(key, serialized)
+    
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'disk_tier': self.cache_dir is not None
+        }
+    
+    def _store(self, key, result, size):
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        self._entries[key] = (result, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+    
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+    
+    def _read_disk(self, key):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._disk_path(key)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cache entry {key}: {e}")
+            return None
+    
+    def _write_disk(self, key, serialized):
+        if not self.cache_dir:
+            return
+        # Write to a temporary file first so other workers never read a partial entry
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(serialized)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Failed to write cache entry {key}: {e}")
 
-memory_monitor = MemoryMonitor()
+result_cache = ResultCache(AppConfig.RESULT_CACHE_MAX_ENTRIES,
+                           AppConfig.RESULT_CACHE_MAX_BYTES,
+                           AppConfig.RESULT_CACHE_DIR)
 
 # Flask app setup with minimal configuration
 app = Flask(__name__)
@@ -151,7 +851,7 @@ app.config.from_object(AppConfig)
 
 # Set environment
 os.environ['FLASK_ENV'] = AppConfig.ENV
-os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'  # Suppress TensorFlow warnings
+os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')  # Suppress TensorFlow warnings unless configured
 app.env = AppConfig.ENV
 
 # Configure CORS with environment variable support
@@ -171,9 +871,345 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in AppConfig.ALLOWED_EXTENSIONS
 
+def process_cpus():
+    """Sorted ids of the cores this process may run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(psutil.cpu_count(logical=True) or 1))
+
+def format_cpu_list(cpus):
+    """Compact form of a sorted core id list, e.g. '0-7,16-23'"""
+    ranges = []
+    for cpu in cpus:
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(str(first) if first == last else f"{first}-{last}" for first, last in ranges)
+
+def configure_tensorflow():
+    """Create the Keras session with thread pools sized for this process.
+    
+    Left to its defaults, TensorFlow sizes its pools for every core of the
+    node in each Gunicorn worker, so the workers oversubscribe the CPU. The
+    intra-op pool gets TF_INTRA_OP_THREADS threads, or else one per core
+    this process owns: every core it may run on when it is pinned or is the
+    only process ('single' mode), otherwise an equal share among the workers.
+    gunicorn.conf.py exports their number as GUNICORN_WORKERS, and the slot
+    of a worker it actually pinned as CPU_AFFINITY_SLOT, so a CPU_AFFINITY
+    that couldn't be applied still divides the cores. Returns the session
+    config, which frozen graphs use for their own sessions.
+    """
+    global _tensorflow_threads
+    
+    cpus = process_cpus()
+    cpu_slot = os.getenv('CPU_AFFINITY_SLOT')
+    pinned = cpu_slot is not None
+    workers = int(os.getenv('GUNICORN_WORKERS', 1))
+    sharing = 1 if pinned or AppConfig.SERVING_MODE == 'single' else workers
+    intra_op_threads = AppConfig.TF_INTRA_OP_THREADS or max(1, len(cpus) // sharing)
+    inter_op_threads = AppConfig.TF_INTER_OP_THREADS
+    session_config = tf.ConfigProto(intra_op_parallelism_threads=intra_op_threads,
+                                    inter_op_parallelism_threads=inter_op_threads)
+    keras.backend.set_session(tf.Session(config=session_config))
+    _tensorflow_threads = {
+        'intra_op_threads': intra_op_threads,
+        'inter_op_threads': inter_op_threads,
+        'workers': workers,
+        'cpu_pinned': pinned,
+        'cpu_slot': int(cpu_slot) if pinned else None
+    }
+    logger.info(f"TensorFlow session configured - intra-op threads: {intra_op_threads}, "
+                f"inter-op threads: {inter_op_threads}, CPUs: {format_cpu_list(cpus)}"
+                f"{f' (pinned, slot {cpu_slot})' if pinned else ''}")
+    return session_config
+
+def cpu_settings():
+    """Cores and TensorFlow thread settings in effect in this process (the
+    latter are None until the model is loaded)"""
+    cpus = process_cpus()
+    return {
+        'pid': os.getpid(),
+        'cpus': format_cpu_list(cpus),
+        'cpu_count': len(cpus),
+        'tensorflow': _tensorflow_threads
+    }
+
+# Version of the preprocessing and detection code. Part of the model
+# fingerprint, so bump it whenever a code change alters detections for the
+# same config and weights (e.g. 2: mold_inputs stopped normalizing twice).
+PREPROCESSING_VERSION = 2
+
+def compute_model_fingerprint(cfg, weights_path):
+    """Hash the prediction config, the preprocessing code version, the
+    resize backend in use and the weights file so cached results are
+    invalidated whenever any of them changes"""
+    digest = hashlib.sha256()
+    # RESIZE_BACKEND='auto' resizes differently depending on what is installed
+    digest.update(f"preprocessing={PREPROCESSING_VERSION};"
+                  f"resize_backend={resolve_resize_backend(cfg.RESIZE_BACKEND)};".encode())
+    for name in sorted(dir(cfg)):
+        if not name.startswith("__") and not callable(getattr(cfg, name)):
+            digest.update(f"{name}={getattr(cfg, name)!r};".encode())
+    with open(weights_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def image_cache_key(image, w, h, variant):
+    """Content-addressed cache key for a decoded image (of an upload that
+    was originally w x h) under a loaded model variant"""
+    digest = hashlib.blake2b(digest_size=32)
+    digest.update(variant.fingerprint.encode())
+    digest.update(f"{image.shape}{image.dtype}{w}x{h}".encode())
+    digest.update(numpy.ascontiguousarray(image).data)
+    return digest.hexdigest()
+
+def frozen_graph_path(batch_size, directory=None):
+    """Where export_model.py writes (and load_model() reads) the frozen
+    graph for a batch size"""
+    return os.path.join(directory or AppConfig.FROZEN_GRAPH_DIR, f"mask_rcnn_b{batch_size}.pb")
+
+class ModelVariant:
+    """A named model served by the registry: a backbone, a weights file in
+    WEIGHTS_FOLDER and optionally a smaller IMAGE_MAX_DIM.
+    
+    Once loaded it holds one model per batch size (the batch size is baked
+    into the inference graph), the scheduler that batches its requests, the
+    fingerprint its cached results are keyed by, and its latency histograms.
+    """
+    
+    def __init__(self, name, backbone=None, weights_file=None, image_max_dim=None,
+                 frozen_graph_dir=None):
+        self.name = name
+        self.weights_path = os.path.join(AppConfig.WEIGHTS_FOLDER,
+                                         weights_file or AppConfig.WEIGHTS_FILE_NAME)
+        self.frozen_graph_dir = frozen_graph_dir or ''
+        # Config.__init__ derives the input shape and the bucket canvases
+        # from IMAGE_MAX_DIM, so the overrides go on a subclass
+        overrides = {}
+        if backbone:
+            overrides['BACKBONE'] = backbone
+        if image_max_dim:
+            overrides['IMAGE_MAX_DIM'] = int(image_max_dim)
+        self.config_class = type(f"{name.title()}PredictionConfig", (PredictionConfig,), overrides)
+        self.cfg = self.config_class()
+        self.models = {}  # batch size -> MaskRCNN
+        self.scheduler = None
+        self.fingerprint = None
+        self.load_seconds = None
+        self.forward_pass = LatencyHistogram()  # Per batch
+        self.detection = LatencyHistogram()  # Per request, including batching waits
+        self._lock = threading.Lock()
+    
+    @property
+    def loaded(self):
+        return bool(self.models)
+    
+    def artifact_path(self):
+        """The file the variant is loaded from: the smallest batch size's
+        frozen graph with FROZEN_GRAPH_DIR, otherwise the .h5 weights"""
+        if AppConfig.FROZEN_GRAPH_DIR:
+            return frozen_graph_path(min(AppConfig.BATCH_SIZES), self.frozen_graph_dir)
+        return self.weights_path
+    
+    def model_format(self):
+        """'keras', 'frozen', or the quantization mode of a frozen graph"""
+        model = self.models.get(min(self.models)) if self.models else None
+        if not isinstance(model, FrozenMaskRCNN):
+            return 'keras'
+        return model.metadata.get('quantization') or 'frozen'
+    
+    def load(self, session_config=None):
+        """Build the model for every configured batch size (and the
+        scheduler that batches requests across them)"""
+        start_time = time.time()
+        weights_path = self.artifact_path()
+        if self.fingerprint is None:
+            self.fingerprint = compute_model_fingerprint(self.cfg, weights_path)
+            
+        model_folder_path = os.path.abspath("./mrcnn")
+        models = {}
+        for batch_size in AppConfig.BATCH_SIZES:
+            config = make_prediction_config(batch_size, self)
+            if AppConfig.FROZEN_GRAPH_DIR:
+                model = FrozenMaskRCNN(config, frozen_graph_path(batch_size, self.frozen_graph_dir),
+                                       session_config)
+            else:
+                model = MaskRCNN(mode='inference', model_dir=model_folder_path, config=config)
+                model.load_weights(weights_path, by_name=True)
+                # Build the predict function now so the batching thread
+                # doesn't race to create it on first use
+                model.keras_model._make_predict_function()
+            model.precompile(self.input_shapes(), AppConfig.ANCHOR_CACHE_DIR or None)
+            models[batch_size] = model
+        self.models = models
+        
+        # In single-process mode every inference runs on a scheduler's
+        # dedicated thread, even without batching
+        if max(models) > 1 or AppConfig.SERVING_MODE == 'single':
+            self.scheduler = BatchScheduler(self, max_batch_size=max(models),
+                                            window_ms=AppConfig.BATCH_WINDOW_MS)
+        
+        self.load_seconds = time.time() - start_time
+        logger.info(f"Model variant '{self.name}' loaded in {self.load_seconds:.2f} seconds - "
+                    f"backbone: {self.cfg.BACKBONE}, IMAGE_MAX_DIM: {self.cfg.IMAGE_MAX_DIM}, "
+                    f"batch sizes: {sorted(models)}, format: {self.model_format()}")
+    
+    def input_shapes(self):
+        """Input shapes precompiled and warmed up at boot: the WARMUP_SHAPES
+        that fit IMAGE_MAX_DIM, or every canvas the resize mode can produce"""
+        shapes = [shape for shape in AppConfig.WARMUP_SHAPES if max(shape) <= self.cfg.IMAGE_MAX_DIM]
+        if shapes:
+            return shapes
+        if self.cfg.IMAGE_RESIZE_MODE == 'bucket':
+            return list(self.cfg.IMAGE_BUCKETS)
+        return [(self.cfg.IMAGE_MAX_DIM, self.cfg.IMAGE_MAX_DIM)]
+    
+    def run_detection(self, images, timings=None, observe=True):
+        """Run detect() on a list of images using the smallest model that fits.
+        
+        Partial batches are padded with copies of the last image and the extra
+        results are dropped. Stage durations are added to the `timings` dict,
+        and the forward pass time goes to the inference histograms if `observe`.
+        """
+        batch_size = min(size for size in self.models if size >= len(images))
+        padded = list(images) + [images[-1]] * (batch_size - len(images))
+        detect_timings = {}
+        with _graph.as_default():
+            results = self.models[batch_size].detect(padded, verbose=0, timings=detect_timings)
+        if observe:
+            self.observe_forward_pass(batch_size, detect_timings['predict'])
+        if timings is not None:
+            for stage, seconds in detect_timings.items():
+                timings[stage] = timings.get(stage, 0.0) + seconds
+        return results[:len(images)]
+    
+    def group_by_molded_shape(self, items, get_image=lambda item: item):
+        """Split items into lists whose images are resized and padded to the same
+        model input shape (see MaskRCNN.molded_shape()), keeping their order"""
+        model = self.models[min(self.models)]
+        groups = OrderedDict()
+        for item in items:
+            groups.setdefault(model.molded_shape(get_image(item).shape), []).append(item)
+        return list(groups.values())
+    
+    def run_tiled_detection(self, image, timings=None, observe=True):
+        """Run detect_tiled() on the model with the largest batch size, so up to
+        that many tiles go through each forward pass. Each forward pass goes
+        to the inference histograms if `observe`."""
+        batch_size = max(self.models)
+        batch_timings = []
+        with _graph.as_default():
+            result = self.models[batch_size].detect_tiled(image, timings=timings,
+                                                          batch_timings=batch_timings)
+        if observe:
+            for detect_timings in batch_timings:
+                self.observe_forward_pass(batch_size, detect_timings['predict'])
+        return result
+    
+    def warm_up(self):
+        """Run a blank image of every input shape through every batch size so
+        TensorFlow finishes graph setup and memory allocation for each shape
+        before the first real request"""
+        for height, width in self.input_shapes():
+            blank = numpy.zeros((height, width, 3), dtype=numpy.uint8)
+            for batch_size in sorted(self.models):
+                batch_start = time.time()
+                self.run_detection([blank] * batch_size, observe=False)
+                logger.info(f"Warm-up of '{self.name}' for {height}x{width}, batch size {batch_size} "
+                            f"took {time.time() - batch_start:.2f}s")
+    
+    def observe_forward_pass(self, batch_size, seconds):
+        prometheus_metrics.observe_inference(self.name, batch_size, seconds)
+        with self._lock:
+            self.forward_pass.observe(seconds)
+    
+    def observe_detection(self, seconds):
+        with self._lock:
+            self.detection.observe(seconds)
+    
+    def input_buffer_stats(self):
+        stats = [model.input_buffer_stats() for model in self.models.values()]
+        return {'sets': sum(stat['sets'] for stat in stats),
+                'bytes': sum(stat['bytes'] for stat in stats)}
+    
+    def stats(self):
+        with self._lock:
+            forward_pass = self.forward_pass.summary()
+            detection = self.detection.summary()
+        return {
+            'loaded': self.loaded,
+            'backbone': self.cfg.BACKBONE,
+            'image_max_dim': self.cfg.IMAGE_MAX_DIM,
+            'weights': os.path.basename(self.weights_path),
+            'format': self.model_format() if self.loaded else None,
+            'batch_sizes': sorted(self.models),
+            'load_seconds': round(self.load_seconds, 2) if self.load_seconds is not None else None,
+            'batching': self.scheduler.stats() if self.scheduler is not None else None,
+            'forward_pass_latency': forward_pass,
+            'detection_latency': detection
+        }
+
+class ModelRegistry:
+    """The model variants of this worker, by name. Requests choose one with
+    their `quality` parameter; variants whose file is missing are skipped
+    at load time, except the default, which every other request uses."""
+    
+    BACKBONES = ('resnet50', 'resnet101')
+    
+    def __init__(self, variants, default_name=None):
+        self.variants = OrderedDict((variant.name, variant) for variant in variants)
+        self.default_name = default_name or next(iter(self.variants))
+        if self.default_name not in self.variants:
+            raise ValueError(f"DEFAULT_VARIANT '{self.default_name}' is not one of MODEL_VARIANTS "
+                             f"({', '.join(self.variants)})")
+    
+    @classmethod
+    def from_config(cls):
+        """Registry of AppConfig.MODEL_VARIANTS, or of the single 'default'
+        variant (WEIGHTS_FILE_NAME, frozen graphs directly in FROZEN_GRAPH_DIR)"""
+        if not AppConfig.MODEL_VARIANTS:
+            return cls([ModelVariant('default', frozen_graph_dir=AppConfig.FROZEN_GRAPH_DIR)])
+            
+        variants = []
+        for entry in AppConfig.MODEL_VARIANTS:
+            if len(entry) not in (3, 4) or not entry[0] or entry[1] not in cls.BACKBONES \
+                    or (len(entry) == 4 and not entry[3].isdigit()):
+                raise ValueError(f"Invalid MODEL_VARIANTS entry '{':'.join(entry)}', expected "
+                                 f"name:{'|'.join(cls.BACKBONES)}:weights file[:image max dim]")
+            # Each variant exports its frozen graphs to its own subdirectory
+            frozen_graph_dir = os.path.join(AppConfig.FROZEN_GRAPH_DIR, entry[0]) \
+                if AppConfig.FROZEN_GRAPH_DIR else ''
+            variants.append(ModelVariant(*entry, frozen_graph_dir=frozen_graph_dir))
+        return cls(variants, AppConfig.DEFAULT_VARIANT)
+    
+    @property
+    def default(self):
+        return self.variants[self.default_name]
+    
+    def get(self, name=None):
+        """The loaded variant called `name` (the default when empty), or None"""
+        variant = self.variants.get(name or self.default_name)
+        return variant if variant is not None and variant.loaded else None
+    
+    def loaded(self):
+        return [variant for variant in self.variants.values() if variant.loaded]
+    
+    def stats(self):
+        return OrderedDict((name, dict(variant.stats(), default=name == self.default_name))
+                           for name, variant in self.variants.items())
+
+model_registry = ModelRegistry.from_config()
+
+def model_format():
+    """Format of the default variant: 'keras', 'frozen', or the
+    quantization mode of a frozen graph"""
+    return model_registry.default.model_format()
+
 def load_model():
-    """Load the Mask R-CNN model safely"""
-    global _model, _graph, _cfg, _model_loaded
+    """Load the Mask R-CNN model variants safely"""
+    global _graph, _model_loaded, _model_load_seconds
     
     if _model_loaded:
         return True
@@ -187,30 +1223,42 @@ def load_model():
             start_time = time.time()
             
             # Check if weights file exists
-            weights_path = os.path.join(AppConfig.WEIGHTS_FOLDER, AppConfig.WEIGHTS_FILE_NAME)
+            weights_path = model_registry.default.artifact_path()
             if not os.path.exists(weights_path):
                 logger.error(f"Model weights not found at {weights_path}")
                 return False
+                
+            logger.info(f"Model config - Image resize mode: {PredictionConfig.IMAGE_RESIZE_MODE}")
             
-            # Create model configuration
-            _cfg = PredictionConfig()
-            logger.info(f"Model config - Image resize mode: {_cfg.IMAGE_RESIZE_MODE}")
-            
-            # Load model
-            model_folder_path = os.path.abspath("./mrcnn")
-            _model = MaskRCNN(mode='inference', model_dir=model_folder_path, config=_cfg)
-            
-            # Load weights
-            _model.load_weights(weights_path, by_name=True)
+            session_config = configure_tensorflow()
             
+            for variant in model_registry.variants.values():
+                if variant is model_registry.default:
+                    variant.load(session_config)
+                    continue
+                # A broken optional variant shouldn't take the default down
+                variant_path = variant.artifact_path()
+                if not os.path.exists(variant_path):
+                    logger.warning(f"Skipping model variant '{variant.name}': {variant_path} not found")
+                    continue
+                try:
+                    variant.load(session_config)
+                except Exception as e:
+                    variant.models, variant.scheduler = {}, None
+                    logger.error(f"Failed to load model variant '{variant.name}': {str(e)}")
+                    
             # Get TensorFlow graph
             _graph = tf.get_default_graph()
             
             _model_loaded = True
             load_time = time.time() - start_time
-            memory_monitor.update()
+            _model_load_seconds = load_time
+            prometheus_metrics.set_model_times(_model_load_seconds, None)
+            memory_monitor.sample()
             
-            logger.info(f"Model loaded successfully in {load_time:.2f} seconds")
+            logger.info(f"Model loaded successfully in {load_time:.2f} seconds - variants: "
+                        f"{', '.join(variant.name for variant in model_registry.loaded())} "
+                        f"(default: {model_registry.default_name})")
             logger.info(f"Memory usage after model load: {memory_monitor.current_memory:.2f} MB")
             
             return True
@@ -219,6 +1267,276 @@ def load_model():
         logger.error(f"Failed to load model: {str(e)}")
         return False
 
+def input_buffer_stats():
+    """Pooled input buffer sets and megabytes, summed over all variants and
+    batch sizes"""
+    stats = [variant.input_buffer_stats() for variant in model_registry.loaded()]
+    return {
+        'enabled': PredictionConfig.INPUT_BUFFER_POOL if _model_loaded else False,
+        'sets': sum(stat['sets'] for stat in stats),
+        'size_mb': round(sum(stat['bytes'] for stat in stats) / 1024 / 1024, 2)
+    }
+
+def warm_up_model():
+    """Warm up every loaded variant (see ModelVariant.warm_up())"""
+    global _warmup_seconds
+    
+    start_time = time.time()
+    for variant in model_registry.loaded():
+        variant.warm_up()
+    _warmup_seconds = time.time() - start_time
+    prometheus_metrics.set_model_times(None, _warmup_seconds)
+    logger.info(f"Model warm-up completed in {_warmup_seconds:.2f} seconds")
+
+def initialize_worker():
+    """Load and warm up the model in this process. Safe to call repeatedly.
+    
+    Called from Gunicorn's post_worker_init hook (and before app.run() when
+    running standalone) so workers only serve traffic once they are warm.
+    """
+    global _model_ready
+    
+    if _model_ready:
+        return True
+    
+    if not load_model():
+        return False
+    
+    try:
+        with _model_lock:
+            if not _model_ready:
+                warm_up_model()
+                if AppConfig.GC_FREEZE:
+                    gc_policy.freeze()
+                _model_ready = True
+        return True
+    except Exception as e:
+        logger.error(f"Model warm-up failed: {str(e)}")
+        return False
+
+class BatchScheduler:
+    """Groups concurrent detection requests into micro-batches.
+    
+    Requests are queued and a single inference thread collects everything that
+    arrives within `window_ms` of the first request (up to `max_batch_size`),
+    runs it through one detect() call of `variant` per molded input shape and
+    hands each caller its own result. Tiled plans are queued the same way but
+    run on their own, so every inference of the variant stays on this thread.
+    """
+    
+    def __init__(self, variant, max_batch_size, window_ms):
+        self.variant = variant
+        # The default variant keeps the original queue name in metrics
+        self.queue_name = 'batch' if variant.name == model_registry.default_name else f'batch_{variant.name}'
+        self.max_batch_size = max_batch_size
+        self.window = window_ms / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.batches_processed = 0
+        self.images_processed = 0
+        self.tiled_processed = 0
+    
+    def submit(self, image, tiled=False):
+        """Queue an image for detection (detect_tiled() if `tiled`) and return
+        a Future that resolves to (result, stage timings of its batch)"""
+        self._ensure_running()
+        future = Future()
+        self._queue.put((image, future, time.time(), tiled))
+        prometheus_metrics.set_queue_depth(self.queue_name, self._queue.qsize())
+        return future
+    
+    def stats(self):
+        return {
+            'max_batch_size': self.max_batch_size,
+            'window_ms': round(self.window * 1000, 2),
+            'queue_depth': self._queue.qsize(),
+            'batches_processed': self.batches_processed,
+            'images_processed': self.images_processed,
+            'average_batch_size': round(self.images_processed / self.batches_processed, 2)
+                                  if self.batches_processed else 0,
+            'tiled_processed': self.tiled_processed
+        }
+    
+    def _ensure_running(self):
+        # Threads don't survive a fork, so (re)start the loop per process
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name=f'batch-scheduler-{self.variant.name}',
+                                                daemon=True)
+                self._thread.start()
+    
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.time() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        prometheus_metrics.set_queue_depth(self.queue_name, self._queue.qsize())
+        return batch
+    
+    def _run(self):
+        while True:
+            collected = self._collect()
+            for item in collected:
+                if item[3]:
+                    self._run_tiled(item)
+            # Images padded to different canvases can't share a detect() call
+            regular = [item for item in collected if not item[3]]
+            for batch in self.variant.group_by_molded_shape(regular, lambda item: item[0]):
+                self._run_batch(batch)
+    
+    def _run_tiled(self, item):
+        start_time = time.time()
+        image, future, enqueued_at, _ = item
+        timings = {}
+        try:
+            result = self.variant.run_tiled_detection(image, timings)
+        except Exception as e:
+            logger.error(f"Tiled inference failed for a {image.shape[1]}x{image.shape[0]} image: {str(e)}")
+            future.set_exception(e)
+            return
+        
+        self.tiled_processed += 1
+        future.set_result((result, dict(timings, queue_wait=start_time - enqueued_at)))
+    
+    def _run_batch(self, batch):
+        batch_start = time.time()
+        images = [image for image, _, _, _ in batch]
+        futures = [future for _, future, _, _ in batch]
+        timings = {}
+        try:
+            results = self.variant.run_detection(images, timings)
+        except Exception as e:
+            logger.error(f"Batch inference failed for {len(batch)} image(s): {str(e)}")
+            for future in futures:
+                future.set_exception(e)
+            return
+        
+        self.batches_processed += 1
+        self.images_processed += len(batch)
+        for (_, future, enqueued_at, _), result in zip(batch, results):
+            future.set_result((result, dict(timings, queue_wait=batch_start - enqueued_at)))
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted for inference"""
+    
+    def __init__(self, status_code, reason, message, retry_after):
+        super().__init__(message)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """Bounds concurrent inferences per worker and sheds load under pressure.
+    
+    Up to `max_inflight` requests run at once and up to `max_waiting` more may
+    wait `wait_timeout` seconds for a slot. Anything beyond that is rejected
+    with 429, and every new request is rejected with 503 while RSS is above
+    `memory_limit_mb`. Rejections carry a Retry-After estimate based on the
+    recent average inference time.
+    """
+    
+    def __init__(self, max_inflight, max_waiting, wait_timeout, memory_limit_mb):
+        self.max_inflight = max_inflight
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.memory_limit_mb = memory_limit_mb
+        self._cond = threading.Condition()
+        self._average_duration = None  # Exponentially weighted, in seconds
+        self.inflight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = {'concurrency': 0, 'queue_timeout': 0, 'memory': 0}
+    
+    def acquire(self, shed=True):
+        """Take an inference slot. With shed=False, block until one frees up
+        instead of rejecting (used by the job workers)."""
+        memory_mb = memory_monitor.update()['current_mb'] if shed and self.memory_limit_mb else 0
+        with self._cond:
+            if memory_mb > self.memory_limit_mb:
+                self._reject(503, 'memory', f"Server memory usage too high ({memory_mb:.0f}MB)")
+            if self.inflight >= self.max_inflight:
+                if shed and self.waiting >= self.max_waiting:
+                    self._reject(429, 'concurrency', 'Too many concurrent requests')
+                self.waiting += 1
+                prometheus_metrics.set_queue_depth('admission', self.waiting)
+                try:
+                    admitted = self._cond.wait_for(lambda: self.inflight < self.max_inflight,
+                                                   timeout=self.wait_timeout if shed else None)
+                finally:
+                    self.waiting -= 1
+                    prometheus_metrics.set_queue_depth('admission', self.waiting)
+                if not admitted:
+                    self._reject(429, 'queue_timeout', 'Timed out waiting for an inference slot')
+            self.inflight += 1
+            self.admitted += 1
+    
+    def release(self, duration):
+        with self._cond:
+            self.inflight -= 1
+            if self._average_duration is None:
+                self._average_duration = duration
+            else:
+                self._average_duration = 0.8 * self._average_duration + 0.2 * duration
+            self._cond.notify()
+    
+    def retry_after(self):
+        """Seconds until the current backlog is expected to drain"""
+        average = self._average_duration or 5.0
+        return max(1, int(math.ceil(average * (self.waiting + 1) / self.max_inflight)))
+    
+    def stats(self):
+        return {
+            'inflight': self.inflight,
+            'waiting': self.waiting,
+            'max_inflight': self.max_inflight,
+            'max_waiting': self.max_waiting,
+            'memory_limit_mb': self.memory_limit_mb,
+            'admitted': self.admitted,
+            'shed_total': sum(self.shed.values()),
+            'shed_by_reason': dict(self.shed),
+            'average_duration_seconds': round(self._average_duration or 0.0, 3)
+        }
+    
+    def _reject(self, status_code, reason, message):
+        self.shed[reason] += 1
+        prometheus_metrics.record_shed(reason)
+        logger.warning(f"Request shed ({reason}): {message}")
+        raise AdmissionRejected(status_code, reason, message, self.retry_after())
+
+admission = AdmissionController(AppConfig.MAX_INFLIGHT_REQUESTS,
+                                AppConfig.MAX_WAITING_REQUESTS,
+                                AppConfig.ADMISSION_WAIT_TIMEOUT,
+                                AppConfig.MEMORY_LIMIT_MB)
+
+def admission_control(f):
+    """Decorator that admits a request through the AdmissionController, or
+    answers 429/503 with a Retry-After header when it is shed"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        try:
+            admission.acquire()
+        except AdmissionRejected as e:
+            response = jsonify({'error': str(e), 'reason': e.reason, 'success': False})
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response, e.status_code
+        
+        start_time = time.time()
+        try:
+            return f(*args, **kwargs)
+        finally:
+            admission.release(time.time() - start_time)
+            
+    return decorated_function
+
 def monitor_request(f):
     """Decorator to monitor request performance and memory usage"""
     @wraps(f)
@@ -226,6 +1544,12 @@ def monitor_request(f):
         global _request_count
         _request_count += 1
         
+        # The legacy route calls predict(), so only the outermost call owns the timings
+        owns_timings = getattr(g, 'timings', None) is None
+        if owns_timings:
+            g.timings = StageTimings()
+        
+        gc_policy.request_started()
         start_time = time.time()
         memory_before = memory_monitor.update()
         
@@ -247,27 +1571,153 @@ def monitor_request(f):
             logger.error(f"Request {_request_count} failed after {processing_time:.2f}s: {str(e)}")
             raise
         finally:
-            # Force garbage collection after each request
-            gc.collect()
+            if owns_timings:
+                g.timings.add('total', time.time() - start_time)
+                stage_metrics.record(g.timings)
+            # Full collections are left to the GC policy thread
+            gc_policy.request_finished()
             
     return decorated_function
 
-def process_image(image_input):
-    """Process input image for model inference"""
+def process_memory_breakdown(process):
+    """Split a process' RSS into private (USS) and shared pages"""
+    info = process.memory_full_info()
+    return {
+        'pid': process.pid,
+        'rss_mb': round(info.rss / (1024**2), 2),
+        'private_mb': round(info.uss / (1024**2), 2),
+        'shared_mb': round((info.rss - info.uss) / (1024**2), 2),
+        'pss_mb': round(getattr(info, 'pss', info.uss) / (1024**2), 2)
+    }
+
+def worker_memory_report():
+    """Shared vs private memory for every worker of the Gunicorn master
+    (or just this process when running standalone)"""
+    process = psutil.Process()
+    parent = process.parent()
+    if parent is not None and 'gunicorn' in ' '.join(parent.cmdline()):
+        processes = parent.children()
+    else:
+        processes = [process]
+    
+    workers = []
+    for proc in processes:
+        try:
+            workers.append(process_memory_breakdown(proc))
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+    
+    return {
+        'workers': workers,
+        'total_rss_mb': round(sum(w['rss_mb'] for w in workers), 2),
+        'total_private_mb': round(sum(w['private_mb'] for w in workers), 2),
+        'total_pss_mb': round(sum(w['pss_mb'] for w in workers), 2)
+    }
+
+def decode_target_dim(variant=None):
+    """Long side the model (the default variant unless given) resizes inputs
+    to, or None if it doesn't downscale"""
+    cfg = (variant or model_registry.default).cfg
+    if not AppConfig.FAST_DECODE or cfg.IMAGE_RESIZE_MODE not in ('square', 'bucket'):
+        return None
+    if AppConfig.TILED_DETECTION:
+        # Large plans are tiled at native resolution instead of resized
+        return AppConfig.TILE_MAX_DIM
+    return cfg.IMAGE_MAX_DIM
+
+def decode_image(image_input, target_dim=None):
+    """Decode an opened PIL image into a uint8 RGB array.
+    
+    When `target_dim` is set and the image is larger, it is decoded at a
+    reduced size whose long side is still at least `target_dim`: JPEGs use
+    DCT scaling via draft(), other formats are box-reduced right after
+    decoding. The model resizes to `target_dim` anyway, so detections are
+    unaffected, but the full-resolution array is never built.
+    
+    Returns (image, original width, original height).
+    """
     try:
-        image = numpy.asarray(image_input)
-        h, w, c = image.shape
+        w, h = image_input.size
+        scale = target_dim / max(w, h) if target_dim else 1.0
         
-        if image.ndim != 3:
-            image = skimage.color.gray2rgb(image)
-        if image.shape[-1] == 4:
-            image = image[..., :3]
-            
+        if scale < 1.0 and image_input.format == 'JPEG':
+            image_input.draft('RGB', (int(math.ceil(w * scale)), int(math.ceil(h * scale))))
+        image_input.load()
+        
+        if image_input.mode not in ('L', 'RGB', 'RGBA'):
+            # Palette, CMYK, 16-bit, ... can't be reduced directly
+            image_input = image_input.convert('RGB')
+        
+        if scale < 1.0:
+            factor = int(max(image_input.size) // target_dim)
+            if factor >= 2:
+                image_input = image_input.reduce(factor)
+        
+        # Alpha is dropped, not composited
+        image = numpy.asarray(image_input.convert('RGB'))
         return image, w, h
     except Exception as e:
         logger.error(f"Image processing failed: {str(e)}")
         raise
 
+def rasterize_pdf(data, target_dim, max_pages):
+    """Render every page of a PDF straight at the size the model uses, so
+    its long side is `target_dim` pixels (no high-DPI render + downscale).
+    
+    Uses PyMuPDF when installed, otherwise pdf2image (poppler). Returns a
+    list of (image, width, height) with uint8 RGB arrays, or raises
+    UploadError if no renderer is available or the PDF has too many pages.
+    """
+    try:
+        import fitz  # PyMuPDF
+    except ImportError:
+        fitz = None
+    
+    if fitz is not None:
+        document = fitz.open(stream=data, filetype='pdf')
+        try:
+            if document.page_count > max_pages:
+                raise UploadError(f"PDF has {document.page_count} pages; at most {max_pages} are supported")
+            pages = []
+            for page in document:
+                zoom = target_dim / max(page.rect.width, page.rect.height)
+                render = getattr(page, 'get_pixmap', None) or page.getPixmap  # PyMuPDF < 1.18.14
+                pixmap = render(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+                image = numpy.frombuffer(pixmap.samples, dtype=numpy.uint8).reshape(
+                    pixmap.height, pixmap.width, pixmap.n)
+                if pixmap.n != 3:
+                    image = numpy.asarray(PIL.Image.fromarray(image.squeeze()).convert('RGB'))
+                pages.append((image, pixmap.width, pixmap.height))
+            return pages
+        finally:
+            document.close()
+    
+    try:
+        import pdf2image
+    except ImportError:
+        raise UploadError('PDF support is not installed on this server', 415)
+    
+    page_count = pdf2image.pdfinfo_from_bytes(data)['Pages']
+    if page_count > max_pages:
+        raise UploadError(f"PDF has {page_count} pages; at most {max_pages} are supported")
+    # size=N makes pdftoppm fit each page in an N x N box, i.e. long side = N
+    pages = []
+    for page in pdf2image.convert_from_bytes(data, size=target_dim):
+        image = numpy.asarray(page.convert('RGB'))
+        pages.append((image, image.shape[1], image.shape[0]))
+    return pages
+
+def scale_boxes(bbx, image, w, h):
+    """Map (y1, x1, y2, x2) boxes from a decoded image back to the original
+    w x h upload"""
+    scale_y = h / image.shape[0]
+    scale_x = w / image.shape[1]
+    if scale_y == 1.0 and scale_x == 1.0:
+        return bbx
+    return [[int(round(y1 * scale_y)), int(round(x1 * scale_x)),
+             int(round(y2 * scale_y)), int(round(x2 * scale_x))]
+            for y1, x1, y2, x2 in bbx]
+
 def get_class_names(class_ids):
     """Convert class IDs to class names"""
     class_mapping = {1: 'wall', 2: 'window', 3: 'door'}
@@ -296,6 +1746,410 @@ def format_predictions(objects_arr):
     """Format prediction results to JSON"""
     return [{'x1': obj[1], 'y1': obj[0], 'x2': obj[3], 'y2': obj[2]} for obj in objects_arr]
 
+class UploadError(Exception):
+    """Raised when the uploaded file is missing or not a readable image"""
+    
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+def requested_quality():
+    """The `quality` parameter (query string or form field) of the current
+    request, or the default variant's name if there is none"""
+    return request.args.get('quality') or request.form.get('quality') or model_registry.default_name
+
+def requested_variant():
+    """The loaded model variant named by the current request's `quality`, or
+    None if it isn't configured or failed to load"""
+    return model_registry.get(requested_quality())
+
+def variant_error_response():
+    """400 when `quality` names no configured variant, 503 when the variant is
+    configured but wasn't loaded in this worker"""
+    name = requested_quality()
+    if name not in model_registry.variants:
+        names = ', '.join(model_registry.variants)
+        return jsonify({'error': f"Unknown quality, expected one of: {names}", 'success': False}), 400
+    return jsonify({'error': f"Model variant unavailable: {name}", 'success': False}), 503
+
+def read_uploaded_pages(timings, variant):
+    """Validate the `image` upload of the current request and decode it
+    for the model variant that will analyze it.
+    
+    Returns (pages, is_pdf) where pages is a list of (image, width, height):
+    one entry for an image, one per page for a PDF. Raises UploadError.
+    """
+    with timings.stage('upload_read'):
+        files = request.files
+    
+    if 'image' not in files:
+        raise UploadError('No image file provided')
+    
+    file = files['image']
+    if file.filename == '':
+        raise UploadError('No file selected')
+    
+    if not allowed_file(file.filename):
+        raise UploadError('Invalid file type')
+    
+    is_pdf = file.stream.read(5) == b'%PDF-'
+    file.stream.seek(0)
+    
+    try:
+        if is_pdf:
+            with timings.stage('rasterize'):
+                target_dim = variant.cfg.IMAGE_MAX_DIM
+                return rasterize_pdf(file.stream.read(), target_dim, AppConfig.PDF_MAX_PAGES), True
+        
+        with timings.stage('decode'):
+            # open() only reads the header, so the size is known before decoding
+            image_input = PIL.Image.open(file.stream)
+            return [decode_image(image_input, decode_target_dim(variant))], False
+    except UploadError:
+        raise
+    except Exception as e:
+        logger.error(f"Image processing error: {str(e)}")
+        raise UploadError('Invalid PDF file' if is_pdf else 'Invalid image file')
+
+def combine_page_results(page_results, is_pdf):
+    """Response fields for an upload: the result itself for an image, and
+    for a PDF the first page's fields (for clients that expect a single
+    plan) plus every page under `pages`"""
+    if not is_pdf:
+        return page_results[0]
+    pages = [dict(result, page=index + 1) for index, result in enumerate(page_results)]
+    return dict(page_results[0], pages=pages, num_pages=len(pages))
+
+def detect_images(images, timings, variant):
+    """Run detection on decoded images with a model variant, letting its
+    scheduler batch them or calling detect() in chunks of the largest batch
+    size. With TILED_DETECTION, images larger than TILE_MIN_DIM are tiled
+    instead (on the scheduler's thread too, when there is one)."""
+    predictions = [None] * len(images)
+    tiled = {index for index, image in enumerate(images)
+             if AppConfig.TILED_DETECTION and max(image.shape[:2]) > AppConfig.TILE_MIN_DIM}
+    
+    if variant.scheduler is not None:
+        futures = [(index, variant.scheduler.submit(image, tiled=index in tiled))
+                   for index, image in enumerate(images)]
+        for index, future in futures:
+            predictions[index], detect_timings = future.result(timeout=AppConfig.REQUEST_TIMEOUT)
+            timings.update(detect_timings)
+        return predictions
+    
+    for index in sorted(tiled):
+        detect_timings = {}
+        predictions[index] = variant.run_tiled_detection(images[index], detect_timings)
+        timings.update(detect_timings)
+    
+    regular = [index for index in range(len(images)) if index not in tiled]
+    chunk_size = max(variant.models)
+    for group in variant.group_by_molded_shape(regular, lambda index: images[index]):
+        for start in range(0, len(group), chunk_size):
+            chunk = group[start:start + chunk_size]
+            detect_timings = {}
+            chunk_predictions = variant.run_detection([images[index] for index in chunk], detect_timings)
+            for index, prediction in zip(chunk, chunk_predictions):
+                predictions[index] = prediction
+            timings.update(detect_timings)
+    return predictions
+
+def analyze_images(pages, timings, variant):
+    """Run (or fetch from cache) detection for a list of decoded images
+    with a model variant.
+    
+    `pages` holds (image, w, h) tuples where `w` and `h` are the size of the
+    original upload, which may be larger than `image` when it was decoded
+    at reduced scale; boxes are mapped back to the original. Uncached pages
+    are detected together so they can share batches.
+    
+    Returns a list of (result, cache_hit) where result holds the response
+    fields shared by /predict and /jobs. Stage durations are added to
+    `timings` (summed over pages).
+    """
+    # Identical uploads under the same model reuse the previous result
+    with timings.stage('cache_lookup'):
+        cache_keys = [image_cache_key(image, w, h, variant) for image, w, h in pages]
+        results = [result_cache.get(cache_key) for cache_key in cache_keys]
+    pending = [index for index, result in enumerate(results) if result is None]
+    
+    if pending:
+        # Pages go in as decoded; mold_inputs resizes and normalizes them
+        detect_start = time.time()
+        predictions = detect_images([pages[index][0] for index in pending], timings, variant)
+        variant.observe_detection(time.time() - detect_start)
+        
+        for index, prediction in zip(pending, predictions):
+            image, w, h = pages[index]
+            
+            # Process results
+            with timings.stage('format'):
+                bbx = scale_boxes(prediction['rois'].tolist(), image, w, h)
+                normalized_points, average_door = normalize_points(bbx, prediction['class_ids'])
+                formatted_points = format_predictions(normalized_points)
+                class_names = get_class_names(prediction['class_ids'])
+            
+            results[index] = {
+                'points': formatted_points,
+                'classes': class_names,
+                'width': w,
+                'height': h,
+                'average_door': float(average_door),
+                'num_detections': len(bbx)
+            }
+            with timings.stage('cache_store'):
+                result_cache.put(cache_keys[index], results[index])
+    
+    return [(result, index not in pending) for index, result in enumerate(results)]
+
+class JobQueue:
+    """Bounded queue of asynchronous detection jobs drained by a worker pool.
+    
+    Job state is kept in memory and mirrored to `jobs_dir` as JSON, so a job
+    can be polled through any Gunicorn worker on the node, not just the one
+    that accepted it. Finished jobs are dropped after `result_ttl` seconds.
+    Queued jobs (the decoded pages) only live in the accepting process, so
+    every record carries its owner's pid: jobs still unfinished when their
+    worker exits are marked failed, by the worker itself (`shutdown`) or by
+    whichever worker next sees the record (`fail_orphaned_jobs`, `get`).
+    """
+    
+    def __init__(self, num_workers, max_queued, jobs_dir, result_ttl):
+        self.num_workers = num_workers
+        self.jobs_dir = jobs_dir
+        self.result_ttl = result_ttl
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pid = None
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_run = 0.0
+        
+        os.makedirs(self.jobs_dir, exist_ok=True)
+    
+    def submit(self, pages, is_pdf, variant):
+        """Queue decoded pages for a model variant and return the new job
+        record. Raises queue.Full."""
+        self._ensure_running()
+        self._purge_expired()
+        job = {
+            'id': uuid.uuid4().hex,
+            'status': 'queued',
+            'variant': variant.name,
+            'pid': os.getpid(),
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'result': None,
+            'error': None
+        }
+        try:
+            self._queue.put_nowait((job, pages, is_pdf, variant))
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            raise
+        with self._lock:
+            self._jobs[job['id']] = job
+            self.submitted += 1
+        prometheus_metrics.set_queue_depth('jobs', self.depth())
+        self._save(job)
+        return job
+    
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        # The job may have been accepted by another worker process. Ids are
+        # hex, so anything else can't be a job file (and can't escape jobs_dir).
+        if not all(c in '0123456789abcdef' for c in job_id):
+            return None
+        try:
+            with open(self._job_path(job_id)) as f:
+                job = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Failed to read job {job_id}: {e}")
+            return None
+        if self._is_orphaned(job):
+            self._fail_orphan(job)
+        return job
+    
+    def shutdown(self, timeout):
+        """Give this worker's unfinished jobs up to `timeout` seconds to
+        complete, then mark the rest failed. Called when the worker exits."""
+        deadline = time.time() + timeout
+        while self._unfinished() and time.time() < deadline:
+            time.sleep(0.1)
+        unfinished = self._unfinished()
+        for job in unfinished:
+            self._update(job, status='failed', error='Worker exited before the job finished',
+                         finished_at=time.time())
+        if unfinished:
+            logger.warning(f"Marked {len(unfinished)} unfinished job(s) failed on worker exit")
+    
+    def fail_orphaned_jobs(self):
+        """Mark failed the queued or running job records whose worker is
+        gone (e.g. killed after a timeout, before it could run `shutdown`).
+        Their pages were only held in that worker, so they can't be re-queued."""
+        orphaned = 0
+        try:
+            entries = list(os.scandir(self.jobs_dir))
+        except OSError as e:
+            logger.warning(f"Failed to scan jobs directory: {e}")
+            return 0
+        for entry in entries:
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                with open(entry.path) as f:
+                    job = json.load(f)
+            except Exception:
+                continue
+            if self._is_orphaned(job):
+                self._fail_orphan(job)
+                orphaned += 1
+        if orphaned:
+            logger.warning(f"Marked {orphaned} orphaned job(s) failed")
+        return orphaned
+    
+    def depth(self):
+        return self._queue.qsize()
+    
+    def retry_after(self):
+        """Seconds until a queue slot is likely to free up"""
+        average_run = self.total_run / self.completed if self.completed else 10.0
+        return max(1, int(round(average_run * (self.depth() + 1) / max(1, self.num_workers))))
+    
+    def stats(self):
+        finished = self.completed + self.failed
+        return {
+            'queue_depth': self.depth(),
+            'queue_capacity': self._queue.maxsize,
+            'workers': self.num_workers,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'average_wait_seconds': round(self.total_wait / finished, 3) if finished else 0.0,
+            'max_wait_seconds': round(self.max_wait, 3),
+            'average_run_seconds': round(self.total_run / finished, 3) if finished else 0.0
+        }
+    
+    def _ensure_running(self):
+        # Threads don't survive a fork, so (re)start the pool per process
+        with self._lock:
+            if self._pid == os.getpid() and all(t.is_alive() for t in self._threads):
+                return
+            self._pid = os.getpid()
+            self._threads = [t for t in self._threads if t.is_alive()]
+            for i in range(len(self._threads), self.num_workers):
+                thread = threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+    
+    def _run(self):
+        while True:
+            job, pages, is_pdf, variant = self._queue.get()
+            prometheus_metrics.set_queue_depth('jobs', self.depth())
+            succeeded = False
+            # Jobs share the worker's inference slots with /predict but are
+            # never shed once accepted
+            admission.acquire(shed=False)
+            started = time.time()
+            wait = started - job['created_at']
+            self._update(job, status='running', started_at=started)
+            timings = StageTimings()
+            try:
+                page_results = [result for result, _ in analyze_images(pages, timings, variant)]
+                result = combine_page_results(page_results, is_pdf)
+                self._update(job, status='completed', result=result, finished_at=time.time(),
+                             timings_ms=timings.as_ms())
+                succeeded = True
+            except Exception as e:
+                logger.error(f"Job {job['id']} failed: {str(e)}")
+                self._update(job, status='failed', error='Model inference failed', finished_at=time.time())
+            finally:
+                admission.release(time.time() - started)
+                stage_metrics.record(timings)
+                # Don't keep the decoded images alive while waiting for the next job
+                del pages
+            
+            with self._lock:
+                if succeeded:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+                self.total_run += time.time() - started
+    
+    def _unfinished(self):
+        with self._lock:
+            return [job for job in self._jobs.values() if job['status'] in ('queued', 'running')]
+    
+    def _is_orphaned(self, job):
+        """Whether a job record is unfinished but its owner can't finish it:
+        the owner process is gone, or its pid now belongs to this process,
+        which never accepted the job"""
+        pid = job.get('pid')
+        if job.get('status') not in ('queued', 'running') or pid is None:
+            return False
+        if pid == os.getpid():
+            with self._lock:
+                return job['id'] not in self._jobs
+        return not psutil.pid_exists(pid)
+    
+    def _fail_orphan(self, job):
+        job.update(status='failed', error='Worker exited before the job finished',
+                   finished_at=time.time())
+        self._save(job)
+    
+    def _update(self, job, **fields):
+        with self._lock:
+            job.update(fields)
+        self._save(job)
+    
+    def _job_path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+    
+    def _save(self, job):
+        path = self._job_path(job['id'])
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with self._lock:
+                serialized = json.dumps(job)
+            with open(tmp_path, 'w') as f:
+                f.write(serialized)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Failed to persist job {job['id']}: {e}")
+    
+    def _purge_expired(self):
+        cutoff = time.time() - self.result_ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job['finished_at'] is not None and job['finished_at'] < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+        try:
+            for entry in os.scandir(self.jobs_dir):
+                if entry.name.endswith('.json') and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+        except OSError as e:
+            logger.warning(f"Failed to purge expired jobs: {e}")
+
+job_queue = JobQueue(AppConfig.JOB_WORKERS, AppConfig.JOB_QUEUE_MAX,
+                     AppConfig.JOBS_DIR, AppConfig.JOB_RESULT_TTL)
+
 # Routes
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -306,13 +2160,26 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'model_loaded': _model_loaded,
+        'ready': _model_ready,
         'uptime_seconds': round(uptime, 2),
         'requests_processed': _request_count,
         'memory_stats': memory_stats,
+        'cpu': cpu_settings(),
         'tensorflow_version': tf.__version__,
         'environment': 'production'
     })
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Readiness endpoint: 200 only once the model is loaded and warmed up"""
+    response = {
+        'ready': _model_ready,
+        'model_loaded': _model_loaded,
+        'model_load_seconds': round(_model_load_seconds, 2) if _model_load_seconds is not None else None,
+        'warmup_seconds': round(_warmup_seconds, 2) if _warmup_seconds is not None else None
+    }
+    return jsonify(response), 200 if _model_ready else 503
+
 @app.route('/metrics', methods=['GET'])
 def metrics():
     """Detailed metrics endpoint"""
@@ -328,38 +2195,82 @@ def metrics():
         'memory_percent': memory_stats['memory_percent'],
         'cpu_percent': memory_stats['cpu_percent'],
         'model_loaded': _model_loaded,
+        'model_ready': _model_ready,
+        'model_load_seconds': _model_load_seconds,
+        'model_format': model_format(),
+        'warmup_seconds': _warmup_seconds,
         'tensorflow_version': tf.__version__,
         'python_version': sys.version,
         'environment': 'production',
-        'psutil_available': memory_monitor.psutil_available
+        'serving_mode': AppConfig.SERVING_MODE,
+        'psutil_available': memory_monitor.psutil_available,
+        'batching': model_registry.default.scheduler.stats()
+                    if model_registry.default.scheduler is not None else None,
+        'default_variant': model_registry.default_name,
+        'model_variants': model_registry.stats(),
+        'result_cache': result_cache.stats(),
+        'jobs': job_queue.stats(),
+        'admission': admission.stats(),
+        'stage_latency': stage_metrics.summary(),
+        'gc': gc_policy.stats(),
+        'input_buffers': input_buffer_stats()
     })
 
+@app.route('/metrics/prometheus', methods=['GET'])
+def prometheus_metrics_endpoint():
+    """Prometheus/OpenMetrics exposition, aggregated across Gunicorn workers"""
+    if not prometheus_metrics.available:
+        return jsonify({'error': 'prometheus_client is not installed', 'success': False}), 501
+    
+    body, content_type = prometheus_metrics.render(request.headers.get('Accept'))
+    return app.response_class(body, mimetype=None, content_type=content_type)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.time()
+    g.request_observed = False
+    prometheus_metrics.track_inflight(1)
+
+@app.after_request
+def observe_request(response):
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    prometheus_metrics.observe_request(endpoint, request.method, response.status_code,
+                                       time.time() - g.request_start)
+    g.request_observed = True
+    return response
+
+@app.teardown_request
+def finish_request(exc):
+    if 'request_start' not in g:
+        return
+    prometheus_metrics.track_inflight(-1)
+    if not g.request_observed:
+        # after_request is skipped when the view raised
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        prometheus_metrics.observe_request(endpoint, request.method, 500,
+                                           time.time() - g.request_start)
+
 @app.route('/memory', methods=['GET'])
 def memory_status():
     """Real-time memory monitoring endpoint for speedometer display"""
     try:
-        # Get comprehensive memory information
-        memory_info = psutil.virtual_memory()
-        swap_info = psutil.swap_memory()
+        # Everything here comes from the background sampler, so polling
+        # this endpoint never blocks on psutil
+        sample = memory_monitor.latest()
+        if not memory_monitor.psutil_available:
+            raise RuntimeError('psutil not available')
         
-        # Calculate memory usage
-        total_memory_gb = memory_info.total / (1024**3)
-        used_memory_gb = memory_info.used / (1024**3)
-        available_memory_gb = memory_info.available / (1024**3)
-        memory_percent = memory_info.percent
+        total_memory_gb = sample['system_total_mb'] / 1024
+        used_memory_gb = sample['system_used_mb'] / 1024
+        available_memory_gb = sample['system_available_mb'] / 1024
+        memory_percent = sample['system_memory_percent']
         
-        # Get process-specific memory usage
-        process = psutil.Process()
-        process_memory_mb = process.memory_info().rss / (1024**2)
-        process_memory_percent = (process.memory_info().rss / memory_info.total) * 100
-        
-        # CPU information for additional context
-        cpu_percent = psutil.cpu_percent(interval=0.1)
-        cpu_count = psutil.cpu_count()
+        process_memory_mb = sample['rss_mb']
+        process_memory_percent = sample['memory_percent']
         
         return jsonify({
             'success': True,
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': datetime.fromtimestamp(sample['timestamp']).isoformat(),
             'system_memory': {
                 'total_gb': round(total_memory_gb, 2),
                 'used_gb': round(used_memory_gb, 2),
@@ -373,14 +2284,19 @@ def memory_status():
                 'percent_of_total': round(process_memory_percent, 2)
             },
             'swap_memory': {
-                'total_gb': round(swap_info.total / (1024**3), 2),
-                'used_gb': round(swap_info.used / (1024**3), 2),
-                'usage_percent': round(swap_info.percent, 1)
+                'total_gb': round(sample['swap_total_mb'] / 1024, 2),
+                'used_gb': round(sample['swap_used_mb'] / 1024, 2),
+                'usage_percent': round(sample['swap_percent'], 1)
             },
             'cpu_info': {
-                'usage_percent': round(cpu_percent, 1),
-                'core_count': cpu_count
+                'usage_percent': round(sample['system_cpu_percent'], 1),
+                'core_count': psutil.cpu_count()
+            },
+            'threads': {
+                'count': sample['num_threads'],
+                'busiest': memory_monitor.thread_stats[:10]
             },
+            'worker_memory': memory_monitor.worker_memory,
             'ai_server_status': {
                 'model_loaded': _model_loaded,
                 'requests_processed': _request_count,
@@ -405,8 +2321,27 @@ def memory_status():
             }
         }), 500
 
+@app.route('/memory/history', methods=['GET'])
+def memory_history():
+    """Sampled resource usage of this worker, oldest first"""
+    try:
+        since = float(request.args['since']) if 'since' in request.args else None
+    except ValueError:
+        return jsonify({'error': 'since must be a Unix timestamp', 'success': False}), 400
+    
+    memory_monitor.latest()  # Make sure the sampler is running in this worker
+    samples = memory_monitor.get_history(since)
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'interval_seconds': memory_monitor.interval,
+        'capacity': memory_monitor.history.maxlen,
+        'samples': samples
+    })
+
 @app.route('/predict', methods=['POST'])
 @monitor_request
+@admission_control
 def predict():
     """Main prediction endpoint"""
     try:
@@ -415,54 +2350,35 @@ def predict():
             if not load_model():
                 return jsonify({'error': 'Model not loaded', 'success': False}), 500
         
-        # Validate request
-        if 'image' not in request.files:
-            return jsonify({'error': 'No image file provided', 'success': False}), 400
-        
-        file = request.files['image']
-        if file.filename == '':
-            return jsonify({'error': 'No file selected', 'success': False}), 400
-        
-        if not allowed_file(file.filename):
-            return jsonify({'error': 'Invalid file type', 'success': False}), 400
+        variant = requested_variant()
+        if variant is None:
+            return variant_error_response()
         
-        # Process image
+        timings = g.timings
         try:
-            image_input = PIL.Image.open(file.stream)
-            image, w, h = process_image(image_input)
-        except Exception as e:
-            logger.error(f"Image processing error: {str(e)}")
-            return jsonify({'error': 'Invalid image file', 'success': False}), 400
+            pages, is_pdf = read_uploaded_pages(timings, variant)
+        except UploadError as e:
+            return jsonify({'error': str(e), 'success': False}), e.status_code
         
         # Run model inference
         try:
-            scaled_image = mold_image(image, _cfg)
-            sample = expand_dims(scaled_image, 0)
-            
-            with _graph.as_default():
-                predictions = _model.detect(sample, verbose=0)[0]
+            page_results = analyze_images(pages, timings, variant)
+            result = combine_page_results([result for result, _ in page_results], is_pdf)
             
-            # Process results
-            bbx = predictions['rois'].tolist()
-            normalized_points, average_door = normalize_points(bbx, predictions['class_ids'])
-            formatted_points = format_predictions(normalized_points)
-            class_names = get_class_names(predictions['class_ids'])
-            
-            response_data = {
-                'success': True,
-                'points': formatted_points,
-                'classes': class_names,
-                'width': w,
-                'height': h,
-                'average_door': average_door,
-                'num_detections': len(bbx),
-                'processing_info': {
-                    'request_id': _request_count,
-                    'timestamp': datetime.now().isoformat()
-                }
+            image, w, h = pages[0]
+            processing_info = {
+                'request_id': _request_count,
+                'timestamp': datetime.now().isoformat(),
+                'model_variant': variant.name,
+                'cache_hit': all(cache_hit for _, cache_hit in page_results),
+                'decode_scale': round(image.shape[1] / w, 4)
             }
+            if request.args.get('timings', '').lower() in ('1', 'true'):
+                processing_info['timings_ms'] = timings.as_ms()
+            response_data = dict(result, success=True, processing_info=processing_info)
             
-            return jsonify(response_data)
+            with timings.stage('json_serialization'):
+                return jsonify(response_data)
             
         except Exception as e:
             logger.error(f"Model inference error: {str(e)}")
@@ -472,6 +2388,52 @@ def predict():
         logger.error(f"Unexpected error in prediction: {str(e)}")
         return jsonify({'error': 'Internal server error', 'success': False}), 500
 
+@app.route('/jobs', methods=['POST'])
+@monitor_request
+def submit_job():
+    """Queue a floor plan for asynchronous analysis and return its job id"""
+    try:
+        if not _model_loaded:
+            if not load_model():
+                return jsonify({'error': 'Model not loaded', 'success': False}), 500
+        
+        variant = requested_variant()
+        if variant is None:
+            return variant_error_response()
+        
+        try:
+            pages, is_pdf = read_uploaded_pages(g.timings, variant)
+        except UploadError as e:
+            return jsonify({'error': str(e), 'success': False}), e.status_code
+        
+        try:
+            job = job_queue.submit(pages, is_pdf, variant)
+        except queue.Full:
+            response = jsonify({'error': 'Job queue is full', 'success': False})
+            response.headers['Retry-After'] = str(job_queue.retry_after())
+            return response, 503
+        
+        return jsonify({
+            'success': True,
+            'job_id': job['id'],
+            'status': job['status'],
+            'variant': job['variant'],
+            'status_url': f"/jobs/{job['id']}",
+            'queue_position': job_queue.depth()
+        }), 202
+        
+    except Exception as e:
+        logger.error(f"Unexpected error submitting job: {str(e)}")
+        return jsonify({'error': 'Internal server error', 'success': False}), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Poll the status of an asynchronous job, including its result once done"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found', 'success': False}), 404
+    return jsonify(dict(job, success=True))
+
 @app.route('/', methods=['POST'])
 @monitor_request
 def prediction_legacy():
@@ -499,13 +2461,15 @@ def initialize():
     logger.info(f"Initial memory usage: {memory_stats['current_mb']:.2f} MB")
     logger.info("Production environment configured")
     
-    if not load_model():
+    if not initialize_worker():
         logger.error("Failed to load model during initialization")
 
 if __name__ == '__main__':
     # Production-ready server configuration
     logger.info("Starting FloorPlanTo3D Production API...")
     logger.info("Server optimized for concurrent requests and memory monitoring")
+    if not initialize_worker():
+        logger.error("Failed to load model during initialization")
     app.run(
         debug=False, 
         host='0.0.0.0', 
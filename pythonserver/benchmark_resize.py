@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Resize Backend Benchmark
+Times utils.resize() with each installed backend (see RESIZE_BACKEND in
+mrcnn/config.py) on the resizes Mask R-CNN does for images and masks, and
+checks that the outputs match the Scikit-Image reference within tolerance.
+Exits non-zero if a backend is out of tolerance.
+"""
+
+import argparse
+import time
+
+import numpy
+import skimage.io
+
+from mrcnn import utils
+
+
+def load_image(path):
+    """Load an RGB uint8 image, or make a synthetic floor-plan-like one"""
+    if path:
+        return skimage.io.imread(path)[:, :, :3]
+    rng = numpy.random.RandomState(0)
+    image = numpy.full((1700, 2200, 3), 235, dtype=numpy.uint8)
+    for _ in range(300):
+        y, x = rng.randint(0, 1650), rng.randint(0, 2150)
+        if rng.rand() < 0.5:
+            image[y:y + rng.randint(3, 12), x:x + rng.randint(50, 400)] = rng.randint(0, 80)
+        else:
+            image[y:y + rng.randint(50, 400), x:x + rng.randint(3, 12)] = rng.randint(0, 80)
+    noise = rng.randint(-8, 9, image.shape)
+    return numpy.clip(image.astype(numpy.int16) + noise, 0, 255).astype(numpy.uint8)
+
+
+def make_cases(image):
+    """(name, kwargs for utils.resize(), kind) for each resize on the hot path"""
+    h, w = image.shape[:2]
+    scale = 1024 / max(h, w)
+    small = image[:h // 3, :w // 3]
+    # A soft blob like the mask head's output, and a binary ground-truth mask
+    y, x = numpy.mgrid[0:28, 0:28]
+    mask = numpy.exp(-((y - 14) ** 2 + (x - 13) ** 2) / 60).astype(numpy.float32)
+    gt_mask = numpy.zeros((300, 200), dtype=numpy.float32)
+    gt_mask[40:260, 30:170] = 1
+    return [
+        ('image downscale to 1024', dict(image=image, output_shape=(round(h * scale), round(w * scale)),
+                                         preserve_range=True), 'image'),
+        ('image upscale to 1024', dict(image=small, output_shape=(round(h / 3 * 1.5), round(w / 3 * 1.5)),
+                                       preserve_range=True), 'image'),
+        ('unmold_mask 28x28 to box', dict(image=mask, output_shape=(240, 180)), 'mask'),
+        ('minimize_mask binary to 56x56', dict(image=gt_mask, output_shape=(56, 56)), 'mask'),
+    ]
+
+
+def time_resize(kwargs, backend, repeat):
+    result = utils.resize(backend=backend, **kwargs)
+    start_time = time.time()
+    for _ in range(repeat):
+        utils.resize(backend=backend, **kwargs)
+    return result, (time.time() - start_time) / repeat
+
+
+def compare(result, reference, kind):
+    """Mean and max absolute difference, in intensity levels for images and
+    in mask probability for masks, plus the share of mask pixels whose
+    thresholded value differs"""
+    if kind == 'image':
+        # Callers cast the skimage result back to uint8 by truncation
+        difference = numpy.abs(result.astype(numpy.float64) - reference.astype(numpy.uint8))
+        return difference.mean(), difference.max(), None
+    difference = numpy.abs(result.astype(numpy.float64) - reference)
+    flipped = numpy.mean((result >= 0.5) != (reference >= 0.5))
+    return difference.mean(), difference.max(), flipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark utils.resize() backends')
+    parser.add_argument('image', nargs='?', help='Floor plan image (default: synthetic 2200x1700)')
+    parser.add_argument('--repeat', type=int, default=20, help='Timed calls per case')
+    parser.add_argument('--image-tolerance', type=float, default=1.0,
+                        help='Maximum mean difference for images, in intensity levels')
+    parser.add_argument('--mask-tolerance', type=float, default=0.01,
+                        help='Maximum share of mask pixels flipped at the 0.5 threshold')
+    args = parser.parse_args()
+
+    backends = ['skimage'] + [backend for backend in ('opencv', 'pil')
+                              if utils.resolve_resize_backend(backend) == backend]
+    print(f"Backends: {', '.join(backends)} (auto -> {utils.resolve_resize_backend('auto')})")
+
+    failures = 0
+    for name, kwargs, kind in make_cases(load_image(args.image)):
+        print(f"\n{name}: {kwargs['image'].shape} -> {tuple(kwargs['output_shape'])}")
+        reference, reference_seconds = time_resize(kwargs, 'skimage', args.repeat)
+        print(f"  {'skimage':8} {reference_seconds * 1000:8.2f} ms  (reference)")
+        for backend in backends[1:]:
+            result, seconds = time_resize(kwargs, backend, args.repeat)
+            mean_diff, max_diff, flipped = compare(result, reference, kind)
+            if kind == 'image':
+                ok = mean_diff <= args.image_tolerance
+                detail = f"mean diff {mean_diff:.3f}, max {max_diff:.0f} levels"
+            else:
+                ok = flipped <= args.mask_tolerance
+                detail = f"mean diff {mean_diff:.4f}, max {max_diff:.3f}, flipped {flipped:.2%}"
+            failures += not ok
+            print(f"  {backend:8} {seconds * 1000:8.2f} ms  x{reference_seconds / seconds:5.1f}  "
+                  f"{result.dtype}  {detail}  {'OK' if ok else 'OUT OF TOLERANCE'}")
+
+    if failures:
+        print(f"\n{failures} case(s) out of tolerance")
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
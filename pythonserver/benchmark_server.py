@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+FloorPlanTo3D API Throughput Benchmark
+Fires concurrent /predict requests at a running server and reports
+throughput and latency percentiles, to compare serving layouts
+(SERVING_MODE=multiprocess vs SERVING_MODE=single) on a given node.
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+import requests
+
+
+def send_request(url, image_bytes, filename):
+    start_time = time.time()
+    response = requests.post(url, files={'image': (filename, image_bytes)})
+    return response.status_code, time.time() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the /predict endpoint')
+    parser.add_argument('image', help='Floor plan image to upload')
+    parser.add_argument('--url', default='http://localhost:5000/predict')
+    parser.add_argument('--requests', type=int, default=40, help='Total requests to send')
+    parser.add_argument('--concurrency', type=int, default=8, help='Requests in flight at once')
+    args = parser.parse_args()
+
+    with open(args.image, 'rb') as f:
+        image_bytes = f.read()
+
+    # Note: identical uploads are served from the result cache. Disable it
+    # (RESULT_CACHE_MAX_ENTRIES=0, no RESULT_CACHE_DIR) to measure inference.
+    print(f"Sending {args.requests} requests to {args.url} with concurrency {args.concurrency}")
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = [executor.submit(send_request, args.url, image_bytes, args.image)
+                   for _ in range(args.requests)]
+        results = [future.result() for future in futures]
+    elapsed = time.time() - start_time
+
+    latencies = numpy.array([latency for status, latency in results if status == 200])
+    failures = sum(1 for status, _ in results if status != 200)
+
+    print(f"Completed:   {len(latencies)} ok, {failures} failed in {elapsed:.2f}s")
+    print(f"Throughput:  {len(latencies) / elapsed:.2f} images/sec")
+    if len(latencies):
+        print(f"Latency p50: {numpy.percentile(latencies, 50):.2f}s")
+        print(f"Latency p95: {numpy.percentile(latencies, 95):.2f}s")
+        print(f"Latency p99: {numpy.percentile(latencies, 99):.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+FloorPlanTo3D Frozen Graph Export
+Builds the inference model for each serving batch size, loads the .h5
+weights and writes a frozen, pruned graph per batch size (see
+MaskRCNN.export_frozen_graph()). Point FROZEN_GRAPH_DIR at the output
+directory to serve them; with MODEL_VARIANTS, export each variant with
+--variant into its own subdirectory. Run it again whenever the weights or
+the prediction config change.
+"""
+
+import argparse
+import os
+import time
+
+import keras
+
+from app import AppConfig, frozen_graph_path, make_prediction_config, model_registry
+from mrcnn.model import MaskRCNN
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export frozen inference graphs')
+    parser.add_argument('--variant', choices=list(model_registry.variants),
+                        default=model_registry.default_name, help='Model variant (see MODEL_VARIANTS)')
+    parser.add_argument('--weights', help="Default: the variant's weights file")
+    parser.add_argument('--output-dir', help="Default: the variant's directory in FROZEN_GRAPH_DIR")
+    parser.add_argument('--batch-sizes', default=','.join(str(size) for size in AppConfig.BATCH_SIZES),
+                        help='Comma separated batch sizes to export (default: BATCH_SIZES)')
+    args = parser.parse_args()
+
+    variant = model_registry.variants[args.variant]
+    weights_path = args.weights or variant.weights_path
+    # Named variants are served from their own subdirectory
+    serve_dir = AppConfig.FROZEN_GRAPH_DIR or './weights/frozen'
+    output_dir = args.output_dir or (os.path.join(serve_dir, variant.name) if AppConfig.MODEL_VARIANTS
+                                     else serve_dir)
+
+    os.makedirs(output_dir, exist_ok=True)
+    for batch_size in sorted({int(size) for size in args.batch_sizes.split(',')}):
+        start_time = time.time()
+        # Each export gets a fresh graph so earlier models aren't frozen in
+        keras.backend.clear_session()
+        model = MaskRCNN(mode='inference', model_dir=os.path.abspath('./mrcnn'),
+                         config=make_prediction_config(batch_size, variant))
+        model.load_weights(weights_path, by_name=True)
+        path = frozen_graph_path(batch_size, output_dir)
+        metadata = model.export_frozen_graph(path)
+        print(f"Batch size {batch_size}: {path} ({os.path.getsize(path) / 1024 / 1024:.1f} MB, "
+              f"outputs {', '.join(metadata['outputs'])}) in {time.time() - start_time:.1f}s")
+
+    print(f"Serve with FROZEN_GRAPH_DIR={output_dir if args.output_dir else serve_dir}")
+
+
+if __name__ == '__main__':
+    main()
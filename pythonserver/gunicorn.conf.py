@@ -15,18 +15,45 @@ port = os.getenv('PORT', '5000')
 bind = f"{host}:{port}"
 
 # Smart defaults for production
-workers = min(4, multiprocessing.cpu_count())
-worker_class = "sync"
+serving_mode = os.getenv('SERVING_MODE', 'multiprocess').lower()
+if serving_mode == 'single':
+    # One process owns the model (and every core); HTTP requests are
+    # handled by a thread pool and inference runs on a dedicated thread
+    workers = 1
+    threads = int(os.getenv('HTTP_THREADS', 16))
+    worker_class = "gthread"
+else:
+    workers = min(4, multiprocessing.cpu_count())
+    # Micro-batching (BATCH_SIZES) only helps when a worker serves several
+    # requests at once, so switch to threaded workers when WORKER_THREADS > 1
+    threads = int(os.getenv('WORKER_THREADS', 1))
+    worker_class = "gthread" if threads > 1 else "sync"
 worker_connections = 1000
 timeout = 300  # 5 minutes for ML inference
 keepalive = 2
 backlog = 2048
 
-# Memory management
-max_requests = 100
+# CPU pinning: give every worker a disjoint set of the master's cores (see
+# pre_fork/post_fork below). app.py sizes TensorFlow's thread pools to the
+# worker's share of the cores either way.
+cpu_affinity = os.getenv('CPU_AFFINITY', 'false').lower() == 'true'
+
+# Memory management (never recycle the only worker in single-process mode)
+max_requests = 0 if serving_mode == 'single' else 100
 max_requests_jitter = 20
 preload_app = True
 
+# Prometheus multiprocess mode: workers write metric samples to this
+# directory so /metrics/prometheus aggregates the whole node. It has to be
+# set before the app (and prometheus_client) is imported, and stale files
+# from a previous run are removed.
+prometheus_dir = os.getenv('PROMETHEUS_MULTIPROC_DIR', os.path.join(os.getcwd(), 'prometheus_multiproc'))
+os.environ['PROMETHEUS_MULTIPROC_DIR'] = prometheus_dir
+os.makedirs(prometheus_dir, exist_ok=True)
+for name in os.listdir(prometheus_dir):
+    if name.endswith('.db'):
+        os.remove(os.path.join(prometheus_dir, name))
+
 # Logging
 accesslog = 'access.log'
 errorlog = 'error.log'
@@ -55,6 +82,56 @@ limit_request_field_size = 8190
 def when_ready(server):
     server.log.info("FloorPlanTo3D API server is ready. Listening on: %s", server.address)
 
+def worker_cpus(cpus, slot, num_workers):
+    """The contiguous share of `cpus` that worker `slot` is pinned to"""
+    slot %= num_workers
+    if len(cpus) < num_workers:
+        # More workers than cores: they can't be disjoint, so share them
+        return [cpus[slot % len(cpus)]]
+    return cpus[slot * len(cpus) // num_workers:(slot + 1) * len(cpus) // num_workers]
+
+def pre_fork(server, worker):
+    # Take the lowest CPU slot no live worker holds, so a worker recycled
+    # by max_requests gets the cores of the one it replaces
+    taken = {getattr(other, 'cpu_slot', None) for other in server.WORKERS.values()}
+    worker.cpu_slot = next(slot for slot in range(len(taken) + 1) if slot not in taken)
+
+def post_fork(server, worker):
+    # Runs in the new worker before the app loads the model, so the
+    # TensorFlow session is sized for the worker's cores
+    os.environ['GUNICORN_WORKERS'] = str(server.num_workers)
+    if cpu_affinity and hasattr(os, 'sched_setaffinity'):
+        cpus = worker_cpus(sorted(os.sched_getaffinity(0)), worker.cpu_slot, server.num_workers)
+        os.sched_setaffinity(0, cpus)
+        # Tells the app the worker owns these cores, rather than a share of them
+        os.environ['CPU_AFFINITY_SLOT'] = str(worker.cpu_slot)
+        worker.log.info("Worker %s (slot %s) pinned to CPUs %s", worker.pid, worker.cpu_slot,
+                        ','.join(str(cpu) for cpu in cpus))
+
+def post_worker_init(worker):
+    # Fail the jobs of workers that died without running worker_exit, then
+    # load and warm up the model before this worker starts accepting requests
+    from app import job_queue
+    job_queue.fail_orphaned_jobs()
+    if os.getenv('EAGER_MODEL_LOAD', 'true').lower() == 'true':
+        from app import initialize_worker
+        if not initialize_worker():
+            worker.log.error("Model initialization failed in worker %s", worker.pid)
+
+def worker_exit(server, worker):
+    # Recycled (max_requests) or stopping: finish or fail this worker's jobs
+    # so clients polling them don't wait for the result TTL
+    from app import AppConfig, job_queue
+    job_queue.shutdown(AppConfig.JOB_DRAIN_SECONDS)
+
+def child_exit(server, worker):
+    # Drop the live gauges (in-flight, queue depth) of a worker that exited
+    try:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+    except ImportError:
+        pass
+
 def worker_int(worker):
     worker.log.info("Worker received INT or QUIT signal")
 
@@ -114,6 +114,9 @@ class Config(object):
     # none:   No resizing or padding. Return the image unchanged.
     # square: Resize and pad with zeros to get a square image
     #         of size [max_dim, max_dim].
+    # bucket: Resize as in square mode, then pad to the smallest canvas in
+    #         IMAGE_BUCKETS that fits. Saves the compute spent on padding
+    #         for wide or tall images. Inference only.
     # pad64:  Pads width and height with zeros to make them multiples of 64.
     #         If IMAGE_MIN_DIM or IMAGE_MIN_SCALE are not None, then it scales
     #         up before padding. IMAGE_MAX_DIM is ignored in this mode.
@@ -131,11 +134,24 @@ class Config(object):
     # the width and height, or more, even if MIN_IMAGE_DIM doesn't require it.
     # However, in 'square' mode, it can be overruled by IMAGE_MAX_DIM.
     IMAGE_MIN_SCALE = 0
+    # Canvas sizes [(height, width), ...] for the "bucket" resize mode. If
+    # None, they're derived from IMAGE_BUCKET_RATIOS: for each aspect ratio,
+    # a landscape and a portrait canvas with IMAGE_MAX_DIM as the long side
+    # and the short side rounded up to a multiple of 64.
+    IMAGE_BUCKETS = None
+    IMAGE_BUCKET_RATIOS = [1, 4 / 3, 2]
     # Number of color channels per image. RGB = 3, grayscale = 1, RGB-D = 4
     # Changing this requires other changes in the code. See the WIKI for more
     # details: https://github.com/matterport/Mask_RCNN/wiki
     IMAGE_CHANNEL_COUNT = 3
 
+    # Resize backend for images and masks (see utils.resize()): "auto",
+    # "opencv", "pil" or "skimage". "auto" picks OpenCV, then Pillow, then
+    # Scikit-Image, whichever is installed first. Both are many times
+    # faster than Scikit-Image and match it to within an intensity level
+    # away from the image border. Run benchmark_resize.py to compare.
+    RESIZE_BACKEND = "auto"
+
     # Image mean (RGB)
     MEAN_PIXEL = np.array([123.7, 116.8, 103.9])
 
@@ -174,6 +190,33 @@ class Config(object):
     # Non-maximum suppression threshold for detection
     DETECTION_NMS_THRESHOLD = 0.3
 
+    # Build the mask head in inference mode. Set to False when only boxes
+    # and class IDs are needed: the inference graph is built without the
+    # mask branch and detect() returns masks=None instead of unmolding
+    # full-size instance masks.
+    DETECTION_MASKS = True
+
+    # Reuse the input arrays of detect() (molded images, image metas and
+    # windows) instead of allocating them on every call. Arrays are pooled
+    # per batch size and input shape, and each detect() call checks out its
+    # own set, so concurrent calls never share one.
+    INPUT_BUFFER_POOL = False
+
+    # Inference builds leave out the Batch Norm layers and fold their (frozen)
+    # scale and shift into the preceding conv layers when weights are
+    # loaded. Same detections with fewer ops. Training builds are unaffected.
+    # Not compatible with TRAIN_BN = True, which normalizes with batch
+    # statistics even at inference.
+    FOLD_BATCH_NORM = False
+
+    # Tiled detection (MaskRCNN.detect_tiled()). Large images are cut into
+    # IMAGE_MAX_DIM tiles that overlap by TILE_OVERLAP pixels, so they are
+    # processed at native resolution instead of being squeezed to
+    # IMAGE_MAX_DIM. Objects cut by a tile seam are fused when their pieces
+    # are aligned with at least TILE_FUSE_THRESHOLD 1D IoU.
+    TILE_OVERLAP = 128
+    TILE_FUSE_THRESHOLD = 0.7
+
     # Learning rate and momentum
     # The Mask RCNN paper uses lr=0.02, but on TensorFlow it causes
     # weights to explode. Likely due to differences in optimizer
@@ -223,6 +266,15 @@ class Config(object):
             self.IMAGE_SHAPE = np.array([self.IMAGE_MAX_DIM, self.IMAGE_MAX_DIM,
                 self.IMAGE_CHANNEL_COUNT])
 
+        # Canvas sizes for the "bucket" resize mode
+        if self.IMAGE_BUCKETS is None:
+            buckets = set()
+            for ratio in self.IMAGE_BUCKET_RATIOS:
+                short_side = int(np.ceil(self.IMAGE_MAX_DIM / ratio / 64)) * 64
+                buckets.add((self.IMAGE_MAX_DIM, short_side))
+                buckets.add((short_side, self.IMAGE_MAX_DIM))
+            self.IMAGE_BUCKETS = sorted(buckets)
+
         # Image meta data length
         # See compose_image_meta() for details
         self.IMAGE_META_SIZE = 1 + 3 + 3 + 4 + 1 + self.NUM_CLASSES
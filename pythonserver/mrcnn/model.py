@@ -8,11 +8,15 @@ Written by Waleed Abdulla
 """
 
 import os
+import time
 import random
 import datetime
 import re
 import math
+import hashlib
+import json
 import logging
+import threading
 from collections import OrderedDict
 import multiprocessing
 import numpy as np
@@ -93,7 +97,7 @@ def compute_backbone_shapes(config, image_shape):
 # https://github.com/fchollet/deep-learning-models/blob/master/resnet50.py
 
 def identity_block(input_tensor, kernel_size, filters, stage, block,
-                   use_bias=True, train_bn=True):
+                   use_bias=True, train_bn=True, fold_bn=False):
     """The identity_block is the block that has no conv layer at shortcut
     # Arguments
         input_tensor: input tensor
@@ -103,6 +107,8 @@ def identity_block(input_tensor, kernel_size, filters, stage, block,
         block: 'a','b'..., current block label, used for generating layer names
         use_bias: Boolean. To use or not use a bias in conv layers.
         train_bn: Boolean. Train or freeze Batch Norm layers
+        fold_bn: Boolean. Leave out the Batch Norm layers, whose weights are
+                 folded into the conv layers (see fold_batch_norms())
     """
     nb_filter1, nb_filter2, nb_filter3 = filters
     conv_name_base = 'res' + str(stage) + block + '_branch'
@@ -110,17 +116,20 @@ def identity_block(input_tensor, kernel_size, filters, stage, block,
 
     x = KL.Conv2D(nb_filter1, (1, 1), name=conv_name_base + '2a',
                   use_bias=use_bias)(input_tensor)
-    x = BatchNorm(name=bn_name_base + '2a')(x, training=train_bn)
+    if not fold_bn:
+        x = BatchNorm(name=bn_name_base + '2a')(x, training=train_bn)
     x = KL.Activation('relu')(x)
 
     x = KL.Conv2D(nb_filter2, (kernel_size, kernel_size), padding='same',
                   name=conv_name_base + '2b', use_bias=use_bias)(x)
-    x = BatchNorm(name=bn_name_base + '2b')(x, training=train_bn)
+    if not fold_bn:
+        x = BatchNorm(name=bn_name_base + '2b')(x, training=train_bn)
     x = KL.Activation('relu')(x)
 
     x = KL.Conv2D(nb_filter3, (1, 1), name=conv_name_base + '2c',
                   use_bias=use_bias)(x)
-    x = BatchNorm(name=bn_name_base + '2c')(x, training=train_bn)
+    if not fold_bn:
+        x = BatchNorm(name=bn_name_base + '2c')(x, training=train_bn)
 
     x = KL.Add()([x, input_tensor])
     x = KL.Activation('relu', name='res' + str(stage) + block + '_out')(x)
@@ -128,7 +137,7 @@ def identity_block(input_tensor, kernel_size, filters, stage, block,
 
 
 def conv_block(input_tensor, kernel_size, filters, stage, block,
-               strides=(2, 2), use_bias=True, train_bn=True):
+               strides=(2, 2), use_bias=True, train_bn=True, fold_bn=False):
     """conv_block is the block that has a conv layer at shortcut
     # Arguments
         input_tensor: input tensor
@@ -138,6 +147,8 @@ def conv_block(input_tensor, kernel_size, filters, stage, block,
         block: 'a','b'..., current block label, used for generating layer names
         use_bias: Boolean. To use or not use a bias in conv layers.
         train_bn: Boolean. Train or freeze Batch Norm layers
+        fold_bn: Boolean. Leave out the Batch Norm layers, whose weights are
+                 folded into the conv layers (see fold_batch_norms())
     Note that from stage 3, the first conv layer at main path is with subsample=(2,2)
     And the shortcut should have subsample=(2,2) as well
     """
@@ -147,60 +158,79 @@ def conv_block(input_tensor, kernel_size, filters, stage, block,
 
     x = KL.Conv2D(nb_filter1, (1, 1), strides=strides,
                   name=conv_name_base + '2a', use_bias=use_bias)(input_tensor)
-    x = BatchNorm(name=bn_name_base + '2a')(x, training=train_bn)
+    if not fold_bn:
+        x = BatchNorm(name=bn_name_base + '2a')(x, training=train_bn)
     x = KL.Activation('relu')(x)
 
     x = KL.Conv2D(nb_filter2, (kernel_size, kernel_size), padding='same',
                   name=conv_name_base + '2b', use_bias=use_bias)(x)
-    x = BatchNorm(name=bn_name_base + '2b')(x, training=train_bn)
+    if not fold_bn:
+        x = BatchNorm(name=bn_name_base + '2b')(x, training=train_bn)
     x = KL.Activation('relu')(x)
 
     x = KL.Conv2D(nb_filter3, (1, 1), name=conv_name_base +
                   '2c', use_bias=use_bias)(x)
-    x = BatchNorm(name=bn_name_base + '2c')(x, training=train_bn)
+    if not fold_bn:
+        x = BatchNorm(name=bn_name_base + '2c')(x, training=train_bn)
 
     shortcut = KL.Conv2D(nb_filter3, (1, 1), strides=strides,
                          name=conv_name_base + '1', use_bias=use_bias)(input_tensor)
-    shortcut = BatchNorm(name=bn_name_base + '1')(shortcut, training=train_bn)
+    if not fold_bn:
+        shortcut = BatchNorm(name=bn_name_base + '1')(shortcut, training=train_bn)
 
     x = KL.Add()([x, shortcut])
     x = KL.Activation('relu', name='res' + str(stage) + block + '_out')(x)
     return x
 
 
-def resnet_graph(input_image, architecture, stage5=False, train_bn=True):
+def resnet_graph(input_image, architecture, stage5=False, train_bn=True, fold_bn=False):
     """Build a ResNet graph.
         architecture: Can be resnet50 or resnet101
         stage5: Boolean. If False, stage5 of the network is not created
         train_bn: Boolean. Train or freeze Batch Norm layers
+        fold_bn: Boolean. Leave out the Batch Norm layers, whose weights are
+                 folded into the conv layers (see fold_batch_norms())
     """
     assert architecture in ["resnet50", "resnet101"]
     # Stage 1
     x = KL.ZeroPadding2D((3, 3))(input_image)
     x = KL.Conv2D(64, (7, 7), strides=(2, 2), name='conv1', use_bias=True)(x)
-    x = BatchNorm(name='bn_conv1')(x, training=train_bn)
+    if not fold_bn:
+        x = BatchNorm(name='bn_conv1')(x, training=train_bn)
     x = KL.Activation('relu')(x)
     C1 = x = KL.MaxPooling2D((3, 3), strides=(2, 2), padding="same")(x)
     # Stage 2
-    x = conv_block(x, 3, [64, 64, 256], stage=2, block='a', strides=(1, 1), train_bn=train_bn)
-    x = identity_block(x, 3, [64, 64, 256], stage=2, block='b', train_bn=train_bn)
-    C2 = x = identity_block(x, 3, [64, 64, 256], stage=2, block='c', train_bn=train_bn)
+    x = conv_block(x, 3, [64, 64, 256], stage=2, block='a', strides=(1, 1), train_bn=train_bn,
+                   fold_bn=fold_bn)
+    x = identity_block(x, 3, [64, 64, 256], stage=2, block='b', train_bn=train_bn,
+                       fold_bn=fold_bn)
+    C2 = x = identity_block(x, 3, [64, 64, 256], stage=2, block='c', train_bn=train_bn,
+                            fold_bn=fold_bn)
     # Stage 3
-    x = conv_block(x, 3, [128, 128, 512], stage=3, block='a', train_bn=train_bn)
-    x = identity_block(x, 3, [128, 128, 512], stage=3, block='b', train_bn=train_bn)
-    x = identity_block(x, 3, [128, 128, 512], stage=3, block='c', train_bn=train_bn)
-    C3 = x = identity_block(x, 3, [128, 128, 512], stage=3, block='d', train_bn=train_bn)
+    x = conv_block(x, 3, [128, 128, 512], stage=3, block='a', train_bn=train_bn,
+                   fold_bn=fold_bn)
+    x = identity_block(x, 3, [128, 128, 512], stage=3, block='b', train_bn=train_bn,
+                       fold_bn=fold_bn)
+    x = identity_block(x, 3, [128, 128, 512], stage=3, block='c', train_bn=train_bn,
+                       fold_bn=fold_bn)
+    C3 = x = identity_block(x, 3, [128, 128, 512], stage=3, block='d', train_bn=train_bn,
+                            fold_bn=fold_bn)
     # Stage 4
-    x = conv_block(x, 3, [256, 256, 1024], stage=4, block='a', train_bn=train_bn)
+    x = conv_block(x, 3, [256, 256, 1024], stage=4, block='a', train_bn=train_bn,
+                   fold_bn=fold_bn)
     block_count = {"resnet50": 5, "resnet101": 22}[architecture]
     for i in range(block_count):
-        x = identity_block(x, 3, [256, 256, 1024], stage=4, block=chr(98 + i), train_bn=train_bn)
+        x = identity_block(x, 3, [256, 256, 1024], stage=4, block=chr(98 + i), train_bn=train_bn,
+                           fold_bn=fold_bn)
     C4 = x
     # Stage 5
     if stage5:
-        x = conv_block(x, 3, [512, 512, 2048], stage=5, block='a', train_bn=train_bn)
-        x = identity_block(x, 3, [512, 512, 2048], stage=5, block='b', train_bn=train_bn)
-        C5 = x = identity_block(x, 3, [512, 512, 2048], stage=5, block='c', train_bn=train_bn)
+        x = conv_block(x, 3, [512, 512, 2048], stage=5, block='a', train_bn=train_bn,
+                       fold_bn=fold_bn)
+        x = identity_block(x, 3, [512, 512, 2048], stage=5, block='b', train_bn=train_bn,
+                           fold_bn=fold_bn)
+        C5 = x = identity_block(x, 3, [512, 512, 2048], stage=5, block='c', train_bn=train_bn,
+                                fold_bn=fold_bn)
     else:
         C5 = None
     return [C1, C2, C3, C4, C5]
@@ -899,7 +929,7 @@ def build_rpn_model(anchor_stride, anchors_per_location, depth):
 
 def fpn_classifier_graph(rois, feature_maps, image_meta,
                          pool_size, num_classes, train_bn=True,
-                         fc_layers_size=1024):
+                         fc_layers_size=1024, fold_bn=False):
     """Builds the computation graph of the feature pyramid network classifier
     and regressor heads.
 
@@ -912,6 +942,8 @@ def fpn_classifier_graph(rois, feature_maps, image_meta,
     num_classes: number of classes, which determines the depth of the results
     train_bn: Boolean. Train or freeze Batch Norm layers
     fc_layers_size: Size of the 2 FC layers
+    fold_bn: Boolean. Leave out the Batch Norm layers, whose weights are
+             folded into the conv layers (see fold_batch_norms())
 
     Returns:
         logits: [batch, num_rois, NUM_CLASSES] classifier logits (before softmax)
@@ -926,11 +958,13 @@ def fpn_classifier_graph(rois, feature_maps, image_meta,
     # Two 1024 FC layers (implemented with Conv2D for consistency)
     x = KL.TimeDistributed(KL.Conv2D(fc_layers_size, (pool_size, pool_size), padding="valid"),
                            name="mrcnn_class_conv1")(x)
-    x = KL.TimeDistributed(BatchNorm(), name='mrcnn_class_bn1')(x, training=train_bn)
+    if not fold_bn:
+        x = KL.TimeDistributed(BatchNorm(), name='mrcnn_class_bn1')(x, training=train_bn)
     x = KL.Activation('relu')(x)
     x = KL.TimeDistributed(KL.Conv2D(fc_layers_size, (1, 1)),
                            name="mrcnn_class_conv2")(x)
-    x = KL.TimeDistributed(BatchNorm(), name='mrcnn_class_bn2')(x, training=train_bn)
+    if not fold_bn:
+        x = KL.TimeDistributed(BatchNorm(), name='mrcnn_class_bn2')(x, training=train_bn)
     x = KL.Activation('relu')(x)
 
     shared = KL.Lambda(lambda x: K.squeeze(K.squeeze(x, 3), 2),
@@ -954,7 +988,7 @@ def fpn_classifier_graph(rois, feature_maps, image_meta,
 
 
 def build_fpn_mask_graph(rois, feature_maps, image_meta,
-                         pool_size, num_classes, train_bn=True):
+                         pool_size, num_classes, train_bn=True, fold_bn=False):
     """Builds the computation graph of the mask head of Feature Pyramid Network.
 
     rois: [batch, num_rois, (y1, x1, y2, x2)] Proposal boxes in normalized
@@ -965,6 +999,8 @@ def build_fpn_mask_graph(rois, feature_maps, image_meta,
     pool_size: The width of the square feature map generated from ROI Pooling.
     num_classes: number of classes, which determines the depth of the results
     train_bn: Boolean. Train or freeze Batch Norm layers
+    fold_bn: Boolean. Leave out the Batch Norm layers, whose weights are
+             folded into the conv layers (see fold_batch_norms())
 
     Returns: Masks [batch, num_rois, MASK_POOL_SIZE, MASK_POOL_SIZE, NUM_CLASSES]
     """
@@ -976,26 +1012,30 @@ def build_fpn_mask_graph(rois, feature_maps, image_meta,
     # Conv layers
     x = KL.TimeDistributed(KL.Conv2D(256, (3, 3), padding="same"),
                            name="mrcnn_mask_conv1")(x)
-    x = KL.TimeDistributed(BatchNorm(),
-                           name='mrcnn_mask_bn1')(x, training=train_bn)
+    if not fold_bn:
+        x = KL.TimeDistributed(BatchNorm(),
+                               name='mrcnn_mask_bn1')(x, training=train_bn)
     x = KL.Activation('relu')(x)
 
     x = KL.TimeDistributed(KL.Conv2D(256, (3, 3), padding="same"),
                            name="mrcnn_mask_conv2")(x)
-    x = KL.TimeDistributed(BatchNorm(),
-                           name='mrcnn_mask_bn2')(x, training=train_bn)
+    if not fold_bn:
+        x = KL.TimeDistributed(BatchNorm(),
+                               name='mrcnn_mask_bn2')(x, training=train_bn)
     x = KL.Activation('relu')(x)
 
     x = KL.TimeDistributed(KL.Conv2D(256, (3, 3), padding="same"),
                            name="mrcnn_mask_conv3")(x)
-    x = KL.TimeDistributed(BatchNorm(),
-                           name='mrcnn_mask_bn3')(x, training=train_bn)
+    if not fold_bn:
+        x = KL.TimeDistributed(BatchNorm(),
+                               name='mrcnn_mask_bn3')(x, training=train_bn)
     x = KL.Activation('relu')(x)
 
     x = KL.TimeDistributed(KL.Conv2D(256, (3, 3), padding="same"),
                            name="mrcnn_mask_conv4")(x)
-    x = KL.TimeDistributed(BatchNorm(),
-                           name='mrcnn_mask_bn4')(x, training=train_bn)
+    if not fold_bn:
+        x = KL.TimeDistributed(BatchNorm(),
+                               name='mrcnn_mask_bn4')(x, training=train_bn)
     x = KL.Activation('relu')(x)
 
     x = KL.TimeDistributed(KL.Conv2DTranspose(256, (2, 2), strides=2, activation="relu"),
@@ -1216,7 +1256,8 @@ def load_image_gt(dataset, config, image_id, augment=False, augmentation=None,
         min_dim=config.IMAGE_MIN_DIM,
         min_scale=config.IMAGE_MIN_SCALE,
         max_dim=config.IMAGE_MAX_DIM,
-        mode=config.IMAGE_RESIZE_MODE)
+        mode=config.IMAGE_RESIZE_MODE,
+        backend=config.RESIZE_BACKEND)
     mask = utils.resize_mask(mask, scale, padding, crop)
 
     # Random horizontal flips.
@@ -1277,7 +1318,8 @@ def load_image_gt(dataset, config, image_id, augment=False, augmentation=None,
 
     # Resize masks to smaller size to reduce memory usage
     if use_mini_mask:
-        mask = utils.minimize_mask(bbox, mask, config.MINI_MASK_SHAPE)
+        mask = utils.minimize_mask(bbox, mask, config.MINI_MASK_SHAPE,
+                                   backend=config.RESIZE_BACKEND)
 
     # Image meta data
     image_meta = compose_image_meta(image_id, original_shape, image.shape,
@@ -1429,14 +1471,15 @@ def build_detection_targets(rpn_rois, gt_class_ids, gt_boxes, gt_masks, config):
             gt_h = gt_y2 - gt_y1
             # Resize mini mask to size of GT box
             placeholder[gt_y1:gt_y2, gt_x1:gt_x2] = \
-                np.round(utils.resize(class_mask, (gt_h, gt_w))).astype(bool)
+                np.round(utils.resize(class_mask, (gt_h, gt_w),
+                                      backend=config.RESIZE_BACKEND)).astype(bool)
             # Place the mini batch in the placeholder
             class_mask = placeholder
 
         # Pick part of the mask and resize it
         y1, x1, y2, x2 = rois[i].astype(np.int32)
         m = class_mask[y1:y2, x1:x2]
-        mask = utils.resize(m, config.MASK_SHAPE)
+        mask = utils.resize(m, config.MASK_SHAPE, backend=config.RESIZE_BACKEND)
         masks[i, :, :, class_id] = mask
 
     return rois, roi_gt_class_ids, bboxes, masks
@@ -1835,6 +1878,10 @@ class MaskRCNN():
         self.model_dir = model_dir
         self.set_log_dir()
         self.keras_model = self.build(mode=mode, config=config)
+        # Free input buffer sets per (batch size, height, width), see
+        # config.INPUT_BUFFER_POOL
+        self._input_buffers = {}
+        self._input_buffer_lock = threading.Lock()
 
     def build(self, mode, config):
         """Build Mask R-CNN architecture.
@@ -1851,6 +1898,13 @@ class MaskRCNN():
                             "to avoid fractions when downscaling and upscaling."
                             "For example, use 256, 320, 384, 448, 512, ... etc. ")
 
+        # With FOLD_BATCH_NORM, inference builds leave out the Batch Norm
+        # layers of the ResNet backbone and the heads. Their weights are
+        # folded into the preceding conv layers when weights are loaded.
+        fold_bn = mode == "inference" and config.FOLD_BATCH_NORM
+        if fold_bn and config.TRAIN_BN:
+            raise ValueError("FOLD_BATCH_NORM requires frozen Batch Norm layers (TRAIN_BN = False or None)")
+
         # Inputs
         input_image = KL.Input(
             shape=[None, None, config.IMAGE_SHAPE[2]], name="input_image")
@@ -1898,7 +1952,8 @@ class MaskRCNN():
                                                 train_bn=config.TRAIN_BN)
         else:
             _, C2, C3, C4, C5 = resnet_graph(input_image, config.BACKBONE,
-                                             stage5=True, train_bn=config.TRAIN_BN)
+                                             stage5=True, train_bn=config.TRAIN_BN,
+                                             fold_bn=fold_bn)
         # Top-down Layers
         # TODO: add assert to varify feature map sizes match what's in config
         P5 = KL.Conv2D(config.TOP_DOWN_PYRAMID_SIZE, (1, 1), name='fpn_c5p5')(C5)
@@ -2035,7 +2090,8 @@ class MaskRCNN():
                 fpn_classifier_graph(rpn_rois, mrcnn_feature_maps, input_image_meta,
                                      config.POOL_SIZE, config.NUM_CLASSES,
                                      train_bn=config.TRAIN_BN,
-                                     fc_layers_size=config.FPN_CLASSIF_FC_LAYERS_SIZE)
+                                     fc_layers_size=config.FPN_CLASSIF_FC_LAYERS_SIZE,
+                                     fold_bn=fold_bn)
 
             # Detections
             # output is [batch, num_detections, (y1, x1, y2, x2, class_id, score)] in
@@ -2043,18 +2099,26 @@ class MaskRCNN():
             detections = DetectionLayer(config, name="mrcnn_detection")(
                 [rpn_rois, mrcnn_class, mrcnn_bbox, input_image_meta])
 
-            # Create masks for detections
-            detection_boxes = KL.Lambda(lambda x: x[..., :4])(detections)
-            mrcnn_mask = build_fpn_mask_graph(detection_boxes, mrcnn_feature_maps,
-                                              input_image_meta,
-                                              config.MASK_POOL_SIZE,
-                                              config.NUM_CLASSES,
-                                              train_bn=config.TRAIN_BN)
-
-            model = KM.Model([input_image, input_image_meta, input_anchors],
-                             [detections, mrcnn_class, mrcnn_bbox,
-                                 mrcnn_mask, rpn_rois, rpn_class, rpn_bbox],
-                             name='mask_rcnn')
+            if config.DETECTION_MASKS:
+                # Create masks for detections
+                detection_boxes = KL.Lambda(lambda x: x[..., :4])(detections)
+                mrcnn_mask = build_fpn_mask_graph(detection_boxes, mrcnn_feature_maps,
+                                                  input_image_meta,
+                                                  config.MASK_POOL_SIZE,
+                                                  config.NUM_CLASSES,
+                                                  train_bn=config.TRAIN_BN,
+                                                  fold_bn=fold_bn)
+
+                model = KM.Model([input_image, input_image_meta, input_anchors],
+                                 [detections, mrcnn_class, mrcnn_bbox,
+                                     mrcnn_mask, rpn_rois, rpn_class, rpn_bbox],
+                                 name='mask_rcnn')
+            else:
+                # Detections only. The mask branch is not built.
+                model = KM.Model([input_image, input_image_meta, input_anchors],
+                                 [detections, mrcnn_class, mrcnn_bbox,
+                                     rpn_rois, rpn_class, rpn_bbox],
+                                 name='mask_rcnn')
 
         # Add multi-GPU support.
         if config.GPU_COUNT > 1:
@@ -2110,6 +2174,17 @@ class MaskRCNN():
         if exclude:
             by_name = True
 
+        if self.mode == "inference" and self.config.FOLD_BATCH_NORM:
+            # The Batch Norm layers weren't built. Read everything and let
+            # set_weights_by_name() fold them into the conv layers.
+            weights = read_weights_by_name(filepath)
+            if exclude:
+                weights = {name: values for name, values in weights.items()
+                           if name not in exclude}
+            self.set_weights_by_name(weights)
+            self.set_log_dir(filepath)
+            return
+
         if h5py is None:
             raise ImportError('`load_weights` requires h5py.')
         f = h5py.File(filepath, mode='r')
@@ -2136,6 +2211,36 @@ class MaskRCNN():
         # Update the log directory
         self.set_log_dir(filepath)
 
+    def set_weights_by_name(self, weights):
+        """Assigns weights from a dict of layer name -> list of Numpy arrays,
+        as returned by read_weights_by_name(). Layers that are not in the
+        dict are left untouched, like load_weights(by_name=True).
+
+        With config.FOLD_BATCH_NORM in inference mode, the weights of Batch
+        Norm layers that aren't in the model are folded into their conv
+        layers first (see fold_batch_norms()). Weights that are already
+        folded are used as they are.
+        """
+        # In multi-GPU training, we wrap the model. Get layers
+        # of the inner model because they have the weights.
+        keras_model = self.keras_model
+        layers = keras_model.inner_model.layers if hasattr(keras_model, "inner_model")\
+            else keras_model.layers
+
+        if self.mode == "inference" and self.config.FOLD_BATCH_NORM:
+            weights = fold_batch_norms(weights, keep=[layer.name for layer in layers])
+
+        weight_value_tuples = []
+        for layer in layers:
+            values = weights.get(layer.name)
+            if values is None:
+                continue
+            if len(values) != len(layer.weights):
+                raise ValueError("Layer {} expects {} weights, but {} were provided".format(
+                    layer.name, len(layer.weights), len(values)))
+            weight_value_tuples += zip(layer.weights, values)
+        K.batch_set_value(weight_value_tuples)
+
     def get_imagenet_weights(self):
         """Downloads ImageNet trained weights from Keras.
         Returns path to weights file.
@@ -2378,8 +2483,19 @@ class MaskRCNN():
     def mold_inputs(self, images):
         """Takes a list of images and modifies them to the format expected
         as an input to the neural network.
-        images: List of image matrices [height,width,depth]. Images can have
-            different sizes.
+        images: List of uint8 RGB image matrices [height,width,depth], as
+            decoded. Images can have different sizes but must resize to the
+            same molded shape (see molded_shape()).
+
+        This is the whole preprocessing pipeline: each image is resized
+        once and normalized (MEAN_PIXEL subtracted) straight into its window
+        of a single float32 batch array, and the padding around the window
+        is filled with the normalized value of black. The result is the
+        same as utils.resize_image() followed by mold_image(), without the
+        intermediate full-canvas copies. Don't mold images before passing
+        them in; they would be normalized twice. The arrays come from
+        acquire_input_buffers(), so with config.INPUT_BUFFER_POOL they are
+        reused across detect() calls.
 
         Returns 3 Numpy matrices:
         molded_images: [N, h, w, 3]. Images resized and normalized.
@@ -2387,33 +2503,104 @@ class MaskRCNN():
         windows: [N, (y1, x1, y2, x2)]. The portion of the image that has the
             original image (padding excluded).
         """
-        molded_images = []
-        image_metas = []
-        windows = []
-        for image in images:
+        config = self.config
+        assert config.IMAGE_RESIZE_MODE != "crop", "crop mode is for training only"
+        molded_shapes = [self.molded_shape(image.shape) for image in images]
+        for shape in molded_shapes[1:]:
+            assert shape == molded_shapes[0], \
+                "After resizing, all images must have the same size. Check IMAGE_RESIZE_MODE and image sizes."
+        height, width = molded_shapes[0]
+
+        molded_images, image_metas, windows = self.acquire_input_buffers(
+            len(images), height, width)
+        mean_pixel = np.asarray(config.MEAN_PIXEL, dtype=np.float32)
+        for i, image in enumerate(images):
+            original_shape = image.shape
             # Resize image
-            # TODO: move resizing to mold_image()
-            molded_image, window, scale, padding, crop = utils.resize_image(
-                image,
-                min_dim=self.config.IMAGE_MIN_DIM,
-                min_scale=self.config.IMAGE_MIN_SCALE,
-                max_dim=self.config.IMAGE_MAX_DIM,
-                mode=self.config.IMAGE_RESIZE_MODE)
-            molded_image = mold_image(molded_image, self.config)
+            h, w = image.shape[:2]
+            scale = utils.compute_resize_scale(h, w, min_dim=config.IMAGE_MIN_DIM,
+                                               max_dim=config.IMAGE_MAX_DIM,
+                                               min_scale=config.IMAGE_MIN_SCALE,
+                                               mode=config.IMAGE_RESIZE_MODE)
+            if scale != 1:
+                image = utils.resize(image, (round(h * scale), round(w * scale)),
+                                     preserve_range=True,
+                                     backend=config.RESIZE_BACKEND).astype(image.dtype, copy=False)
+            # Pad (centered) and normalize in place
+            h, w = image.shape[:2]
+            top, left = (height - h) // 2, (width - w) // 2
+            molded = molded_images[i]
+            molded[:top] = -mean_pixel
+            molded[top + h:] = -mean_pixel
+            molded[top:top + h, :left] = -mean_pixel
+            molded[top:top + h, left + w:] = -mean_pixel
+            np.subtract(image, mean_pixel, out=molded[top:top + h, left:left + w],
+                        casting="unsafe")
+            windows[i] = (top, left, top + h, left + w)
             # Build image_meta
-            image_meta = compose_image_meta(
-                0, image.shape, molded_image.shape, window, scale,
-                np.zeros([self.config.NUM_CLASSES], dtype=np.int32))
-            # Append
-            molded_images.append(molded_image)
-            windows.append(window)
-            image_metas.append(image_meta)
-        # Pack into arrays
-        molded_images = np.stack(molded_images)
-        image_metas = np.stack(image_metas)
-        windows = np.stack(windows)
+            image_metas[i] = compose_image_meta(
+                0, original_shape, molded.shape, windows[i], scale,
+                np.zeros([config.NUM_CLASSES], dtype=np.int32))
         return molded_images, image_metas, windows
 
+    def acquire_input_buffers(self, batch_size, height, width):
+        """Returns (molded_images, image_metas, windows) arrays for
+        mold_inputs() to fill, shaped [batch_size, height, width, channels],
+        [batch_size, IMAGE_META_SIZE] and [batch_size, 4].
+
+        With config.INPUT_BUFFER_POOL, a free set for this batch size and
+        shape is taken from the pool if there is one. Hand it back with
+        release_input_buffers() once nothing reads it anymore; sets that are
+        never released are simply garbage collected. Otherwise new arrays
+        are allocated every time.
+        """
+        if self.config.INPUT_BUFFER_POOL:
+            with self._input_buffer_lock:
+                free = self._input_buffers.get((batch_size, height, width))
+                if free:
+                    return free.pop()
+        return (np.empty((batch_size, height, width, self.config.IMAGE_CHANNEL_COUNT),
+                         dtype=np.float32),
+                np.empty((batch_size, self.config.IMAGE_META_SIZE)),
+                np.empty((batch_size, 4), dtype=np.int32))
+
+    def release_input_buffers(self, buffers):
+        """Returns a set of arrays from acquire_input_buffers() to the pool."""
+        if not self.config.INPUT_BUFFER_POOL:
+            return
+        batch_size, height, width = buffers[0].shape[:3]
+        with self._input_buffer_lock:
+            self._input_buffers.setdefault((batch_size, height, width), []).append(buffers)
+
+    def input_buffer_stats(self):
+        """Returns the number of pooled buffer sets and their size in bytes."""
+        with self._input_buffer_lock:
+            sets = [buffers for free in self._input_buffers.values() for buffers in free]
+        return {"sets": len(sets),
+                "bytes": sum(array.nbytes for buffers in sets for array in buffers)}
+
+    def molded_shape(self, image_shape):
+        """Returns the (height, width) that mold_inputs() resizes and pads
+        an image of image_shape to. Images can only share a batch in
+        detect() if their molded shapes match.
+        """
+        config = self.config
+        h, w = image_shape[:2]
+        scale = utils.compute_resize_scale(h, w, min_dim=config.IMAGE_MIN_DIM,
+                                           max_dim=config.IMAGE_MAX_DIM,
+                                           min_scale=config.IMAGE_MIN_SCALE,
+                                           mode=config.IMAGE_RESIZE_MODE)
+        h, w = round(h * scale), round(w * scale)
+        if config.IMAGE_RESIZE_MODE == "square":
+            return (config.IMAGE_MAX_DIM, config.IMAGE_MAX_DIM)
+        if config.IMAGE_RESIZE_MODE == "bucket":
+            return tuple(utils.select_bucket(h, w, config.IMAGE_BUCKETS))
+        if config.IMAGE_RESIZE_MODE == "pad64":
+            return (int(math.ceil(h / 64)) * 64, int(math.ceil(w / 64)) * 64)
+        if config.IMAGE_RESIZE_MODE == "crop":
+            return (config.IMAGE_MIN_DIM, config.IMAGE_MIN_DIM)
+        return (h, w)
+
     def unmold_detections(self, detections, mrcnn_mask, original_image_shape,
                           image_shape, window):
         """Reformats the detections of one image from the format of the neural
@@ -2421,7 +2608,7 @@ class MaskRCNN():
         application.
 
         detections: [N, (y1, x1, y2, x2, class_id, score)] in normalized coordinates
-        mrcnn_mask: [N, height, width, num_classes]
+        mrcnn_mask: [N, height, width, num_classes], or None to skip masks
         original_image_shape: [H, W, C] Original image shape before resizing
         image_shape: [H, W, C] Shape of the image after resizing and padding
         window: [y1, x1, y2, x2] Pixel coordinates of box in the image where the real
@@ -2431,7 +2618,8 @@ class MaskRCNN():
         boxes: [N, (y1, x1, y2, x2)] Bounding boxes in pixels
         class_ids: [N] Integer class IDs for each bounding box
         scores: [N] Float probability scores of the class_id
-        masks: [height, width, num_instances] Instance masks
+        masks: [height, width, num_instances] Instance masks, or None if
+            mrcnn_mask is None
         """
         # How many detections do we have?
         # Detections array is padded with zeros. Find the first class_id == 0.
@@ -2442,7 +2630,8 @@ class MaskRCNN():
         boxes = detections[:N, :4]
         class_ids = detections[:N, 4].astype(np.int32)
         scores = detections[:N, 5]
-        masks = mrcnn_mask[np.arange(N), :, :, class_ids]
+        masks = mrcnn_mask[np.arange(N), :, :, class_ids]\
+            if mrcnn_mask is not None else None
 
         # Translate normalized coordinates in the resized image to pixel
         # coordinates in the original image before resizing
@@ -2465,30 +2654,39 @@ class MaskRCNN():
             boxes = np.delete(boxes, exclude_ix, axis=0)
             class_ids = np.delete(class_ids, exclude_ix, axis=0)
             scores = np.delete(scores, exclude_ix, axis=0)
-            masks = np.delete(masks, exclude_ix, axis=0)
+            if masks is not None:
+                masks = np.delete(masks, exclude_ix, axis=0)
             N = class_ids.shape[0]
 
+        if masks is None:
+            return boxes, class_ids, scores, None
+
         # Resize masks to original image size and set boundary threshold.
         full_masks = []
         for i in range(N):
             # Convert neural network mask to full size mask
-            full_mask = utils.unmold_mask(masks[i], boxes[i], original_image_shape)
+            full_mask = utils.unmold_mask(masks[i], boxes[i], original_image_shape,
+                                          backend=self.config.RESIZE_BACKEND)
             full_masks.append(full_mask)
         full_masks = np.stack(full_masks, axis=-1)\
             if full_masks else np.empty(original_image_shape[:2] + (0,))
 
         return boxes, class_ids, scores, full_masks
 
-    def detect(self, images, verbose=0):
+    def detect(self, images, verbose=0, timings=None):
         """Runs the detection pipeline.
 
         images: List of images, potentially of different sizes.
+        timings: Optional dict. If provided, the wall time in seconds of the
+            "mold_inputs", "predict" and "unmold_detections" stages is added
+            to it.
 
         Returns a list of dicts, one dict per image. The dict contains:
         rois: [N, (y1, x1, y2, x2)] detection bounding boxes
         class_ids: [N] int class IDs
         scores: [N] float probability scores for the class IDs
-        masks: [H, W, N] instance binary masks
+        masks: [H, W, N] instance binary masks. None if the model was
+            built with config.DETECTION_MASKS = False.
         """
         assert self.mode == "inference", "Create model in inference mode."
         assert len(
@@ -2500,7 +2698,10 @@ class MaskRCNN():
                 log("image", image)
 
         # Mold inputs to format expected by the neural network
+        stage_start = time.time()
         molded_images, image_metas, windows = self.mold_inputs(images)
+        if timings is not None:
+            timings["mold_inputs"] = timings.get("mold_inputs", 0) + time.time() - stage_start
 
         # Validate image sizes
         # All images in a batch MUST be of the same size
@@ -2509,24 +2710,26 @@ class MaskRCNN():
             assert g.shape == image_shape,\
                 "After resizing, all images must have the same size. Check IMAGE_RESIZE_MODE and image sizes."
 
-        # Anchors
-        anchors = self.get_anchors(image_shape)
-        # Duplicate across the batch dimension because Keras requires it
-        # TODO: can this be optimized to avoid duplicating the anchors?
-        anchors = np.broadcast_to(anchors, (self.config.BATCH_SIZE,) + anchors.shape)
+        # Anchors, duplicated across the batch dimension
+        anchors = self.get_batch_anchors(image_shape)
 
         if verbose:
             log("molded_images", molded_images)
             log("image_metas", image_metas)
             log("anchors", anchors)
         # Run object detection
-        detections, _, _, mrcnn_mask, _, _, _ =\
-            self.keras_model.predict([molded_images, image_metas, anchors], verbose=0)
+        stage_start = time.time()
+        detections, mrcnn_mask =\
+            self.predict_detections(molded_images, image_metas, anchors)
+        if timings is not None:
+            timings["predict"] = timings.get("predict", 0) + time.time() - stage_start
         # Process detections
+        stage_start = time.time()
         results = []
         for i, image in enumerate(images):
             final_rois, final_class_ids, final_scores, final_masks =\
-                self.unmold_detections(detections[i], mrcnn_mask[i],
+                self.unmold_detections(detections[i],
+                                       mrcnn_mask[i] if mrcnn_mask is not None else None,
                                        image.shape, molded_images[i].shape,
                                        windows[i])
             results.append({
@@ -2535,8 +2738,85 @@ class MaskRCNN():
                 "scores": final_scores,
                 "masks": final_masks,
             })
+        self.release_input_buffers((molded_images, image_metas, windows))
+        if timings is not None:
+            timings["unmold_detections"] = timings.get("unmold_detections", 0) + \
+                time.time() - stage_start
         return results
 
+    def detect_tiled(self, image, tile_size=None, overlap=None, verbose=0, timings=None,
+                     batch_timings=None):
+        """Runs the detection pipeline on a large image in overlapping tiles.
+
+        The image is cut into tile_size x tile_size tiles (see
+        utils.compute_tiles()) that go through detect() BATCH_SIZE at a
+        time, so memory is bounded by the tile size rather than the image
+        size. Detections are shifted back to image coordinates and merged
+        across tiles with utils.merge_tile_detections().
+
+        image: [H, W, C] image.
+        tile_size: Tile side in pixels. Defaults to IMAGE_MAX_DIM, which
+            keeps tiles at native resolution in the "square" and
+            "bucket" resize modes.
+        overlap: Overlap between neighbouring tiles in pixels. Defaults to
+            config.TILE_OVERLAP.
+        timings: Optional dict, as in detect(). Stages are summed over tiles.
+        batch_timings: Optional list. The stage timings dict of each detect()
+            call (one per batch of tiles) is appended to it.
+
+        Returns a dict like detect(). masks is always None.
+        """
+        assert self.mode == "inference", "Create model in inference mode."
+        tile_size = tile_size or self.config.IMAGE_MAX_DIM
+        overlap = self.config.TILE_OVERLAP if overlap is None else overlap
+        height, width = image.shape[:2]
+
+        tiles = utils.compute_tiles(height, width, tile_size, overlap)
+        if verbose:
+            log("Processing {}x{} image in {} tiles".format(width, height, len(tiles)))
+
+        boxes, class_ids, scores, truncated = [], [], [], []
+        batch_size = self.config.BATCH_SIZE
+        for start in range(0, len(tiles), batch_size):
+            windows = tiles[start:start + batch_size]
+            crops = [image[y1:y2, x1:x2] for y1, x1, y2, x2 in windows]
+            # Pad the last batch with copies of its last tile
+            crops += [crops[-1]] * (batch_size - len(crops))
+            detect_timings = {}
+            results = self.detect(crops, verbose=0, timings=detect_timings)
+            if timings is not None:
+                for stage, seconds in detect_timings.items():
+                    timings[stage] = timings.get(stage, 0) + seconds
+            if batch_timings is not None:
+                batch_timings.append(detect_timings)
+
+            for (y1, x1, y2, x2), r in zip(windows, results):
+                rois = r["rois"]
+                boxes.append(rois + np.array([y1, x1, y1, x1], dtype=rois.dtype))
+                class_ids.append(r["class_ids"])
+                scores.append(r["scores"])
+                # Touching a tile edge that isn't also an image edge
+                margin = 2
+                truncated.append(((rois[:, 0] <= margin) & (y1 > 0)) |
+                                 ((rois[:, 1] <= margin) & (x1 > 0)) |
+                                 ((rois[:, 2] >= y2 - y1 - margin) & (y2 < height)) |
+                                 ((rois[:, 3] >= x2 - x1 - margin) & (x2 < width)))
+
+        stage_start = time.time()
+        final_rois, final_class_ids, final_scores = utils.merge_tile_detections(
+            np.concatenate(boxes), np.concatenate(class_ids),
+            np.concatenate(scores), np.concatenate(truncated),
+            self.config.DETECTION_NMS_THRESHOLD, self.config.TILE_FUSE_THRESHOLD)
+        if timings is not None:
+            timings["merge_tiles"] = timings.get("merge_tiles", 0) + time.time() - stage_start
+
+        return {
+            "rois": final_rois,
+            "class_ids": final_class_ids,
+            "scores": final_scores,
+            "masks": None,
+        }
+
     def detect_molded(self, molded_images, image_metas, verbose=0):
         """Runs the detection pipeline, but expect inputs that are
         molded already. Used mostly for debugging and inspecting
@@ -2549,7 +2829,8 @@ class MaskRCNN():
         rois: [N, (y1, x1, y2, x2)] detection bounding boxes
         class_ids: [N] int class IDs
         scores: [N] float probability scores for the class IDs
-        masks: [H, W, N] instance binary masks
+        masks: [H, W, N] instance binary masks. None if the model was
+            built with config.DETECTION_MASKS = False.
         """
         assert self.mode == "inference", "Create model in inference mode."
         assert len(molded_images) == self.config.BATCH_SIZE,\
@@ -2566,25 +2847,23 @@ class MaskRCNN():
         for g in molded_images[1:]:
             assert g.shape == image_shape, "Images must have the same size"
 
-        # Anchors
-        anchors = self.get_anchors(image_shape)
-        # Duplicate across the batch dimension because Keras requires it
-        # TODO: can this be optimized to avoid duplicating the anchors?
-        anchors = np.broadcast_to(anchors, (self.config.BATCH_SIZE,) + anchors.shape)
+        # Anchors, duplicated across the batch dimension
+        anchors = self.get_batch_anchors(image_shape)
 
         if verbose:
             log("molded_images", molded_images)
             log("image_metas", image_metas)
             log("anchors", anchors)
         # Run object detection
-        detections, _, _, mrcnn_mask, _, _, _ =\
-            self.keras_model.predict([molded_images, image_metas, anchors], verbose=0)
+        detections, mrcnn_mask =\
+            self.predict_detections(molded_images, image_metas, anchors)
         # Process detections
         results = []
         for i, image in enumerate(molded_images):
             window = [0, 0, image.shape[0], image.shape[1]]
             final_rois, final_class_ids, final_scores, final_masks =\
-                self.unmold_detections(detections[i], mrcnn_mask[i],
+                self.unmold_detections(detections[i],
+                                       mrcnn_mask[i] if mrcnn_mask is not None else None,
                                        image.shape, molded_images[i].shape,
                                        window)
             results.append({
@@ -2595,6 +2874,62 @@ class MaskRCNN():
             })
         return results
 
+    def predict_detections(self, molded_images, image_metas, anchors):
+        """Runs the inference graph on molded inputs.
+
+        Returns:
+        detections: [batch, N, (y1, x1, y2, x2, class_id, score)] in
+            normalized coordinates
+        mrcnn_mask: [batch, N, height, width, num_classes], or None if the
+            model was built with config.DETECTION_MASKS = False
+        """
+        outputs = self.keras_model.predict(
+            [molded_images, image_metas, anchors], verbose=0)
+        if self.config.DETECTION_MASKS:
+            return outputs[0], outputs[3]
+        return outputs[0], None
+
+    def export_frozen_graph(self, path):
+        """Writes the inference graph to path as a frozen GraphDef (.pb),
+        with the weights folded in as constants and everything detect()
+        doesn't use pruned: only the detections (and mrcnn_mask if
+        config.DETECTION_MASKS) are kept as outputs. Input and output
+        tensor names and the config settings baked into the graph are
+        written next to it in a .json file. Load it with FrozenMaskRCNN.
+
+        Returns the metadata written to the .json file.
+        """
+        assert self.mode == "inference", "Create model in inference mode."
+        keras_model = self.keras_model
+        outputs = [keras_model.outputs[0]]
+        if self.config.DETECTION_MASKS:
+            outputs.append(keras_model.outputs[3])
+        output_names = [tensor.op.name for tensor in outputs]
+
+        session = K.get_session()
+        graph_def = tf.graph_util.convert_variables_to_constants(
+            session, session.graph.as_graph_def(), output_names)
+
+        metadata = {
+            "inputs": [tensor.name for tensor in keras_model.inputs],
+            "outputs": [tensor.name for tensor in outputs],
+            "learning_phase": None,
+            "config": {key: repr(getattr(self.config, key))
+                       for key in FrozenMaskRCNN.GRAPH_CONFIG_KEYS},
+        }
+        # Old Keras versions may leave the learning phase placeholder in
+        # the graph, and it has to be fed
+        learning_phase = K.learning_phase()
+        if not isinstance(learning_phase, int) and \
+                any(node.name == learning_phase.op.name for node in graph_def.node):
+            metadata["learning_phase"] = learning_phase.name
+
+        with tf.gfile.GFile(path, "wb") as f:
+            f.write(graph_def.SerializeToString())
+        with open(os.path.splitext(path)[0] + ".json", "w") as f:
+            json.dump(metadata, f, indent=2)
+        return metadata
+
     def get_anchors(self, image_shape):
         """Returns anchor pyramid for the given image size."""
         backbone_shapes = compute_backbone_shapes(self.config, image_shape)
@@ -2617,6 +2952,54 @@ class MaskRCNN():
             self._anchor_cache[tuple(image_shape)] = utils.norm_boxes(a, image_shape[:2])
         return self._anchor_cache[tuple(image_shape)]
 
+    def get_batch_anchors(self, image_shape):
+        """Returns get_anchors() duplicated across the batch dimension
+        because Keras requires it. Cached per image shape as one contiguous
+        array, so it isn't copied again on every predict call.
+        """
+        if not hasattr(self, "_batch_anchor_cache"):
+            self._batch_anchor_cache = {}
+        key = tuple(image_shape)
+        if key not in self._batch_anchor_cache:
+            anchors = self.get_anchors(image_shape)
+            self._batch_anchor_cache[key] = np.ascontiguousarray(
+                np.broadcast_to(anchors, (self.config.BATCH_SIZE,) + anchors.shape))
+        return self._batch_anchor_cache[key]
+
+    def precompile(self, image_shapes, cache_dir=None):
+        """Builds the anchors for the given input shapes ahead of time, so
+        the first detection at each shape doesn't pay for it.
+
+        image_shapes: List of (height, width) molded input shapes.
+        cache_dir: Optional directory. Anchors are loaded from .npy files
+            there when present and saved there otherwise. File names include
+            a hash of the anchor settings, so stale files are never used.
+        """
+        config = self.config
+        anchor_settings = repr((config.RPN_ANCHOR_SCALES, config.RPN_ANCHOR_RATIOS,
+                                config.BACKBONE_STRIDES, config.RPN_ANCHOR_STRIDE,
+                                config.BACKBONE))
+        settings_hash = hashlib.sha1(anchor_settings.encode()).hexdigest()[:12]
+        if not hasattr(self, "_anchor_cache"):
+            self._anchor_cache = {}
+
+        for height, width in image_shapes:
+            image_shape = (height, width, config.IMAGE_CHANNEL_COUNT)
+            path = None
+            if cache_dir:
+                path = os.path.join(cache_dir, "anchors_{}x{}_{}.npy".format(
+                    height, width, settings_hash))
+            if path and os.path.exists(path):
+                if image_shape not in self._anchor_cache:
+                    self._anchor_cache[image_shape] = np.load(path)
+            elif path:
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp_path = "{}.{}.tmp".format(path, os.getpid())
+                with open(tmp_path, "wb") as f:
+                    np.save(f, self.get_anchors(image_shape))
+                os.replace(tmp_path, path)
+            self.get_batch_anchors(image_shape)
+
     def ancestor(self, tensor, name, checked=None):
         """Finds the ancestor of a TF tensor in the computation graph.
         tensor: TensorFlow symbolic tensor.
@@ -2718,6 +3101,166 @@ class MaskRCNN():
         return outputs_np
 
 
+class FrozenMaskRCNN(MaskRCNN):
+    """Runs detection on a graph written by MaskRCNN.export_frozen_graph().
+
+    Nothing is built with Keras and no weights are loaded: the GraphDef is
+    imported into its own graph and session. Preprocessing and
+    postprocessing are the same as MaskRCNN's, so detect(), detect_tiled()
+    and precompile() work as usual. Inference only.
+    """
+
+    # Config settings that are baked into the exported graph. They must
+    # match the config the graph is loaded with.
+    GRAPH_CONFIG_KEYS = [
+        "BACKBONE", "NUM_CLASSES", "BATCH_SIZE", "IMAGE_CHANNEL_COUNT",
+        "TOP_DOWN_PYRAMID_SIZE", "FPN_CLASSIF_FC_LAYERS_SIZE", "POOL_SIZE",
+        "MASK_POOL_SIZE", "POST_NMS_ROIS_INFERENCE", "RPN_NMS_THRESHOLD",
+        "RPN_BBOX_STD_DEV", "BBOX_STD_DEV", "DETECTION_MAX_INSTANCES",
+        "DETECTION_MIN_CONFIDENCE", "DETECTION_NMS_THRESHOLD",
+        "DETECTION_MASKS", "TRAIN_BN"]
+
+    def __init__(self, config, graph_path, session_config=None):
+        """
+        config: A Sub-class of the Config class, matching the one the graph
+            was exported with
+        graph_path: Path of the .pb file. Its .json metadata file must be
+            next to it.
+        session_config: Optional tf.ConfigProto for the session
+        """
+        self.mode = "inference"
+        self.config = config
+        self.model_dir = None
+        self.keras_model = None
+        self._input_buffers = {}
+        self._input_buffer_lock = threading.Lock()
+
+        with open(os.path.splitext(graph_path)[0] + ".json") as f:
+            metadata = json.load(f)
+        self.metadata = metadata
+        mismatched = [key for key in self.GRAPH_CONFIG_KEYS
+                      if metadata["config"].get(key) != repr(getattr(config, key))]
+        if mismatched:
+            raise ValueError("{} was exported with different settings for {}. "
+                             "Export it again.".format(graph_path, ", ".join(mismatched)))
+
+        graph_def = self.read_graph_def(graph_path)
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            tf.import_graph_def(graph_def, name="")
+        self.session = tf.Session(graph=self.graph, config=session_config)
+
+        self._inputs = [self.graph.get_tensor_by_name(name) for name in metadata["inputs"]]
+        self._outputs = [self.graph.get_tensor_by_name(name) for name in metadata["outputs"]]
+        self._feed = {}
+        if metadata["learning_phase"]:
+            self._feed[self.graph.get_tensor_by_name(metadata["learning_phase"])] = False
+
+    @staticmethod
+    def read_graph_def(graph_path):
+        """Reads a GraphDef from a .pb file."""
+        graph_def = tf.GraphDef()
+        with tf.gfile.GFile(graph_path, "rb") as f:
+            graph_def.ParseFromString(f.read())
+        return graph_def
+
+    def predict_detections(self, molded_images, image_metas, anchors):
+        """Runs the frozen graph on molded inputs. See
+        MaskRCNN.predict_detections().
+        """
+        feed = dict(self._feed)
+        feed.update(zip(self._inputs, [molded_images, image_metas, anchors]))
+        outputs = self.session.run(self._outputs, feed_dict=feed)
+        if self.config.DETECTION_MASKS:
+            return outputs[0], outputs[1]
+        return outputs[0], None
+
+
+############################################################
+#  Weights
+############################################################
+
+def read_weights_by_name(filepath):
+    """Reads all layer weights of a Keras .h5 file into memory.
+
+    The arrays are marked read-only so that, when read before forking
+    worker processes, their pages stay shared copy-on-write.
+
+    Returns a dict of layer name -> list of Numpy arrays, in the order
+    expected by MaskRCNN.set_weights_by_name().
+    """
+    import h5py
+
+    def decode(value):
+        return value.decode('utf8') if isinstance(value, bytes) else value
+
+    weights = {}
+    with h5py.File(filepath, mode='r') as f:
+        g = f['model_weights'] if 'layer_names' not in f.attrs and 'model_weights' in f else f
+        for layer_name in g.attrs['layer_names']:
+            layer_group = g[decode(layer_name)]
+            values = []
+            for weight_name in layer_group.attrs['weight_names']:
+                value = np.asarray(layer_group[decode(weight_name)])
+                value.setflags(write=False)
+                values.append(value)
+            if values:
+                weights[decode(layer_name)] = values
+    return weights
+
+
+def folded_conv_name(bn_name):
+    """Returns the name of the conv layer that the Batch Norm layer bn_name
+    follows: bn_conv1 -> conv1, bn2a_branch2a -> res2a_branch2a and
+    mrcnn_class_bn1 -> mrcnn_class_conv1.
+    """
+    if bn_name == "bn_conv1":
+        return "conv1"
+    if bn_name.startswith("bn"):
+        return "res" + bn_name[2:]
+    return bn_name.replace("_bn", "_conv")
+
+
+def fold_batch_norms(weights, keep=(), epsilon=1e-3):
+    """Folds frozen Batch Norm layers into the conv layers before them.
+
+    A frozen Batch Norm computes gamma * (x - mean) / sqrt(variance + epsilon)
+    + beta, an affine function per channel, so it can be merged into the
+    kernel and bias of the preceding conv layer:
+        kernel' = kernel * scale
+        bias' = (bias - mean) * scale + beta
+    where scale = gamma / sqrt(variance + epsilon).
+
+    weights: dict of layer name -> list of Numpy arrays, as returned by
+        read_weights_by_name()
+    keep: Names of Batch Norm layers to leave as they are, typically those
+        that exist in the model.
+    epsilon: The Batch Norm epsilon (the Keras default, used by BatchNorm)
+
+    Returns a new dict without the folded Batch Norm layers. The input is
+    not modified. Layers without a matching conv layer are left as they
+    are, so folding weights twice is harmless.
+    """
+    keep = set(keep)
+    folded = dict(weights)
+    for name, values in weights.items():
+        conv_name = folded_conv_name(name)
+        if name in keep or len(values) != 4 or conv_name == name \
+                or len(weights.get(conv_name, [])) != 2:
+            continue
+        gamma, beta, mean, variance = values
+        kernel, bias = weights[conv_name]
+        scale = gamma / np.sqrt(variance + epsilon)
+        kernel = (kernel * scale).astype(kernel.dtype)
+        bias = ((bias - mean) * scale + beta).astype(bias.dtype)
+        # Keep the read-only flag of read_weights_by_name() arrays
+        for value in (kernel, bias):
+            value.setflags(write=False)
+        folded[conv_name] = [kernel, bias]
+        del folded[name]
+    return folded
+
+
 ############################################################
 #  Data Formatting
 ############################################################
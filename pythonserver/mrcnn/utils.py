@@ -23,6 +23,16 @@ import shutil
 import warnings
 from distutils.version import LooseVersion
 
+# Optional resize backends, see resize()
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+try:
+    import PIL.Image
+except ImportError:
+    PIL = None
+
 # URL from which to download the latest COCO trained weights
 COCO_MODEL_URL = "https://github.com/matterport/Mask_RCNN/releases/download/v2.0/mask_rcnn_coco.h5"
 
@@ -156,6 +166,93 @@ def non_max_suppression(boxes, scores, threshold):
     return np.array(pick, dtype=np.int32)
 
 
+def compute_tiles(height, width, tile_size, overlap):
+    """Computes overlapping tiles that cover an image.
+
+    Tiles are tile_size x tile_size (smaller only when the image itself is
+    smaller) and neighbours overlap by at least `overlap` pixels. The last
+    row and column are shifted inwards rather than cropped, so every tile
+    has full size.
+
+    Returns: [N, (y1, x1, y2, x2)] int tile windows.
+    """
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        count = int(math.ceil((length - overlap) / (tile_size - overlap)))
+        return np.round(np.linspace(0, length - tile_size, count)).astype(np.int32)
+
+    tiles = [(y, x, min(y + tile_size, height), min(x + tile_size, width))
+             for y in starts(height) for x in starts(width)]
+    return np.array(tiles, dtype=np.int32)
+
+
+def merge_tile_detections(boxes, class_ids, scores, truncated,
+                          nms_threshold, fuse_threshold):
+    """Merges detections collected from overlapping tiles of one image.
+
+    Objects in the overlap between tiles are detected twice; those copies
+    are removed with per-class NMS. Objects that cross a tile seam show up
+    as two partial boxes instead. A truncated box is fused with an
+    intersecting box of the same class when the two are aligned across the
+    seam, i.e. their 1D IoU along the x or y axis is >= fuse_threshold.
+
+    boxes: [N, (y1, x1, y2, x2)] in image coordinates.
+    class_ids: [N] int class IDs.
+    scores: [N] float scores.
+    truncated: [N] bool. True if the box touches an inner tile edge, so the
+        object may continue in the neighbouring tile.
+    nms_threshold: Float. IoU above which boxes of a class are duplicates.
+    fuse_threshold: Float. Minimum aligned 1D IoU to fuse seam pieces.
+
+    Returns: boxes, class_ids, scores of the merged detections.
+    """
+    if boxes.shape[0] == 0:
+        return boxes, class_ids, scores
+
+    merged_boxes, merged_class_ids, merged_scores = [], [], []
+    for class_id in np.unique(class_ids):
+        ixs = np.where(class_ids == class_id)[0]
+        ixs = ixs[non_max_suppression(boxes[ixs], scores[ixs], nms_threshold)]
+        class_boxes = boxes[ixs].astype(np.float32)
+        class_scores = scores[ixs]
+        class_truncated = truncated[ixs]
+
+        # Pairwise overlap along each axis
+        y1, x1, y2, x2 = [class_boxes[:, i] for i in range(4)]
+        overlap_y = np.minimum(y2[:, None], y2[None]) - np.maximum(y1[:, None], y1[None])
+        overlap_x = np.minimum(x2[:, None], x2[None]) - np.maximum(x1[:, None], x1[None])
+        iou_y = overlap_y / (np.maximum(y2[:, None], y2[None]) - np.minimum(y1[:, None], y1[None]))
+        iou_x = overlap_x / (np.maximum(x2[:, None], x2[None]) - np.minimum(x1[:, None], x1[None]))
+        fuse = (overlap_y > 0) & (overlap_x > 0) & \
+            (np.maximum(iou_y, iou_x) >= fuse_threshold) & \
+            (class_truncated[:, None] | class_truncated[None])
+
+        # Union-find over fusable pairs, so chains across several seams merge
+        parent = np.arange(len(ixs))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for i, j in zip(*np.where(np.triu(fuse, 1))):
+            parent[find(i)] = find(j)
+
+        roots = np.array([find(i) for i in range(len(ixs))])
+        for root in np.unique(roots):
+            group = np.where(roots == root)[0]
+            merged_boxes.append([y1[group].min(), x1[group].min(),
+                                 y2[group].max(), x2[group].max()])
+            merged_class_ids.append(class_id)
+            merged_scores.append(class_scores[group].max())
+
+    return (np.array(merged_boxes).astype(boxes.dtype),
+            np.array(merged_class_ids, dtype=class_ids.dtype),
+            np.array(merged_scores, dtype=scores.dtype))
+
+
 def apply_box_deltas(boxes, deltas):
     """Applies the given deltas to the given boxes.
     boxes: [N, (y1, x1, y2, x2)]. Note that (y2, x2) is outside the box.
@@ -385,7 +482,36 @@ class Dataset(object):
         return mask, class_ids
 
 
-def resize_image(image, min_dim=None, max_dim=None, min_scale=None, mode="square"):
+def compute_resize_scale(h, w, min_dim=None, max_dim=None, min_scale=None, mode="square"):
+    """Returns the scale factor resize_image() applies to an h x w image."""
+    if mode == "none":
+        return 1
+    scale = 1
+    # Scale?
+    if min_dim:
+        # Scale up but not down
+        scale = max(1, min_dim / min(h, w))
+    if min_scale and scale < min_scale:
+        scale = min_scale
+
+    # Does it exceed max dim?
+    if max_dim and mode in ("square", "bucket"):
+        image_max = max(h, w)
+        if round(image_max * scale) > max_dim:
+            scale = max_dim / image_max
+    return scale
+
+
+def select_bucket(h, w, buckets):
+    """Returns the smallest (height, width) canvas in buckets that fits an
+    h x w image."""
+    fits = [bucket for bucket in buckets if bucket[0] >= h and bucket[1] >= w]
+    assert fits, "No bucket fits a {}x{} image".format(h, w)
+    return min(fits, key=lambda bucket: (bucket[0] * bucket[1], tuple(bucket)))
+
+
+def resize_image(image, min_dim=None, max_dim=None, min_scale=None, mode="square",
+                 buckets=None, backend=None):
     """Resizes an image keeping the aspect ratio unchanged.
 
     min_dim: if provided, resizes the image such that it's smaller
@@ -398,6 +524,9 @@ def resize_image(image, min_dim=None, max_dim=None, min_scale=None, mode="square
         none: No resizing. Return the image unchanged.
         square: Resize and pad with zeros to get a square image
             of size [max_dim, max_dim].
+        bucket: Resize as in square mode, then pad with zeros to the
+            smallest canvas in `buckets` that fits, so wide or tall images
+            aren't padded all the way to a square. Inference only.
         pad64: Pads width and height with zeros to make them multiples of 64.
                If min_dim or min_scale are provided, it scales the image up
                before padding. max_dim is ignored in this mode.
@@ -407,6 +536,7 @@ def resize_image(image, min_dim=None, max_dim=None, min_scale=None, mode="square
               on min_dim and min_scale, then picks a random crop of
               size min_dim x min_dim. Can be used in training only.
               max_dim is not used in this mode.
+    backend: Resize backend, see resize().
 
     Returns:
     image: the resized image
@@ -429,23 +559,12 @@ def resize_image(image, min_dim=None, max_dim=None, min_scale=None, mode="square
     if mode == "none":
         return image, window, scale, padding, crop
 
-    # Scale?
-    if min_dim:
-        # Scale up but not down
-        scale = max(1, min_dim / min(h, w))
-    if min_scale and scale < min_scale:
-        scale = min_scale
-
-    # Does it exceed max dim?
-    if max_dim and mode == "square":
-        image_max = max(h, w)
-        if round(image_max * scale) > max_dim:
-            scale = max_dim / image_max
+    scale = compute_resize_scale(h, w, min_dim, max_dim, min_scale, mode)
 
     # Resize image using bilinear interpolation
     if scale != 1:
         image = resize(image, (round(h * scale), round(w * scale)),
-                       preserve_range=True)
+                       preserve_range=True, backend=backend)
 
     # Need padding or cropping?
     if mode == "square":
@@ -458,6 +577,17 @@ def resize_image(image, min_dim=None, max_dim=None, min_scale=None, mode="square
         padding = [(top_pad, bottom_pad), (left_pad, right_pad), (0, 0)]
         image = np.pad(image, padding, mode='constant', constant_values=0)
         window = (top_pad, left_pad, h + top_pad, w + left_pad)
+    elif mode == "bucket":
+        # Pad to the smallest canvas that fits
+        h, w = image.shape[:2]
+        bucket_h, bucket_w = select_bucket(h, w, buckets)
+        top_pad = (bucket_h - h) // 2
+        bottom_pad = bucket_h - h - top_pad
+        left_pad = (bucket_w - w) // 2
+        right_pad = bucket_w - w - left_pad
+        padding = [(top_pad, bottom_pad), (left_pad, right_pad), (0, 0)]
+        image = np.pad(image, padding, mode='constant', constant_values=0)
+        window = (top_pad, left_pad, h + top_pad, w + left_pad)
     elif mode == "pad64":
         h, w = image.shape[:2]
         # Both sides must be divisible by 64
@@ -514,7 +644,7 @@ def resize_mask(mask, scale, padding, crop=None):
     return mask
 
 
-def minimize_mask(bbox, mask, mini_shape):
+def minimize_mask(bbox, mask, mini_shape, backend=None):
     """Resize masks to a smaller version to reduce memory load.
     Mini-masks can be resized back to image scale using expand_masks()
 
@@ -529,12 +659,12 @@ def minimize_mask(bbox, mask, mini_shape):
         if m.size == 0:
             raise Exception("Invalid bounding box with area of zero")
         # Resize with bilinear interpolation
-        m = resize(m, mini_shape)
+        m = resize(m, mini_shape, backend=backend)
         mini_mask[:, :, i] = np.around(m).astype(np.bool)
     return mini_mask
 
 
-def expand_mask(bbox, mini_mask, image_shape):
+def expand_mask(bbox, mini_mask, image_shape, backend=None):
     """Resizes mini masks back to image size. Reverses the change
     of minimize_mask().
 
@@ -547,7 +677,7 @@ def expand_mask(bbox, mini_mask, image_shape):
         h = y2 - y1
         w = x2 - x1
         # Resize with bilinear interpolation
-        m = resize(m, (h, w))
+        m = resize(m, (h, w), backend=backend)
         mask[y1:y2, x1:x2, i] = np.around(m).astype(np.bool)
     return mask
 
@@ -557,7 +687,7 @@ def mold_mask(mask, config):
     pass
 
 
-def unmold_mask(mask, bbox, image_shape):
+def unmold_mask(mask, bbox, image_shape, backend=None):
     """Converts a mask generated by the neural network to a format similar
     to its original shape.
     mask: [height, width] of type float. A small, typically 28x28 mask.
@@ -567,7 +697,7 @@ def unmold_mask(mask, bbox, image_shape):
     """
     threshold = 0.5
     y1, x1, y2, x2 = bbox
-    mask = resize(mask, (y2 - y1, x2 - x1))
+    mask = resize(mask, (y2 - y1, x2 - x1), backend=backend)
     mask = np.where(mask >= threshold, 1, 0).astype(np.bool)
 
     # Put the mask in the right location.
@@ -658,6 +788,9 @@ def compute_matches(gt_boxes, gt_class_ids, gt_masks,
                     iou_threshold=0.5, score_threshold=0.0):
     """Finds matches between prediction and ground truth instances.
 
+    If gt_masks and pred_masks are None, instances are matched by box IoU
+    instead of mask IoU.
+
     Returns:
         gt_match: 1-D array. For each GT box it has the index of the matched
                   predicted box.
@@ -668,7 +801,6 @@ def compute_matches(gt_boxes, gt_class_ids, gt_masks,
     # Trim zero padding
     # TODO: cleaner to do zero unpadding upstream
     gt_boxes = trim_zeros(gt_boxes)
-    gt_masks = gt_masks[..., :gt_boxes.shape[0]]
     pred_boxes = trim_zeros(pred_boxes)
     pred_scores = pred_scores[:pred_boxes.shape[0]]
     # Sort predictions by score from high to low
@@ -676,10 +808,15 @@ def compute_matches(gt_boxes, gt_class_ids, gt_masks,
     pred_boxes = pred_boxes[indices]
     pred_class_ids = pred_class_ids[indices]
     pred_scores = pred_scores[indices]
-    pred_masks = pred_masks[..., indices]
 
-    # Compute IoU overlaps [pred_masks, gt_masks]
-    overlaps = compute_overlaps_masks(pred_masks, gt_masks)
+    if gt_masks is None and pred_masks is None:
+        # Compute IoU overlaps [pred_boxes, gt_boxes]
+        overlaps = compute_overlaps(pred_boxes, gt_boxes)
+    else:
+        gt_masks = gt_masks[..., :gt_boxes.shape[0]]
+        pred_masks = pred_masks[..., indices]
+        # Compute IoU overlaps [pred_masks, gt_masks]
+        overlaps = compute_overlaps_masks(pred_masks, gt_masks)
 
     # Loop through predictions and find matching ground truth boxes
     match_count = 0
@@ -716,6 +853,7 @@ def compute_ap(gt_boxes, gt_class_ids, gt_masks,
                pred_boxes, pred_class_ids, pred_scores, pred_masks,
                iou_threshold=0.5):
     """Compute Average Precision at a set IoU threshold (default 0.5).
+    Pass None for gt_masks and pred_masks to compute box AP.
 
     Returns:
     mAP: Mean Average Precision
@@ -884,15 +1022,95 @@ def denorm_boxes(boxes, shape):
     return np.around(np.multiply(boxes, scale) + shift).astype(np.int32)
 
 
+RESIZE_BACKENDS = ("auto", "opencv", "pil", "skimage")
+
+
+def resolve_resize_backend(backend):
+    """Returns the resize backend that resize() uses for `backend`.
+
+    None means "skimage", so existing callers keep their exact results.
+    "auto" picks the fastest one installed: OpenCV, then Pillow, then
+    Scikit-Image. A backend that isn't installed falls back to Scikit-Image
+    with a warning.
+    """
+    if backend is None:
+        return "skimage"
+    if backend not in RESIZE_BACKENDS:
+        raise ValueError("Unknown resize backend {}. Use one of {}".format(
+            backend, ", ".join(RESIZE_BACKENDS)))
+    if backend == "auto":
+        if cv2 is not None:
+            return "opencv"
+        return "pil" if PIL is not None else "skimage"
+    if (backend == "opencv" and cv2 is None) or (backend == "pil" and PIL is None):
+        warnings.warn("Resize backend {} is not installed, using skimage".format(backend))
+        return "skimage"
+    return backend
+
+
+def _resize_opencv(image, output_shape, order):
+    """resize() with OpenCV. Keeps the dtype of image."""
+    if order == 0:
+        # Same pixel-center mapping as skimage. INTER_NEAREST rounds down.
+        interpolation = getattr(cv2, "INTER_NEAREST_EXACT", cv2.INTER_NEAREST)
+    else:
+        interpolation = cv2.INTER_LINEAR
+    resized = cv2.resize(np.ascontiguousarray(image),
+                         (output_shape[1], output_shape[0]),
+                         interpolation=interpolation)
+    if image.ndim == 3 and resized.ndim == 2:
+        # OpenCV drops a trailing channel axis of size 1
+        resized = resized[..., np.newaxis]
+    return resized
+
+
+def _resize_pil(image, output_shape, order):
+    """resize() with Pillow. Keeps the dtype of image (uint8 or float32).
+
+    Uses an affine transform rather than Image.resize(), whose bilinear
+    filter widens when shrinking (anti-aliasing) and so doesn't match
+    Scikit-Image.
+    """
+    resample = PIL.Image.NEAREST if order == 0 else PIL.Image.BILINEAR
+    height, width = output_shape[:2]
+    if image.ndim == 2 or (image.dtype == np.uint8 and image.shape[2] in (3, 4)):
+        scale = (image.shape[1] / width, 0, 0, 0, image.shape[0] / height, 0)
+        return np.asarray(PIL.Image.fromarray(image).transform(
+            (width, height), PIL.Image.AFFINE, scale, resample=resample))
+    # Pillow has no multi-channel float modes, so resize channel by channel
+    return np.stack([_resize_pil(image[..., c], output_shape, order)
+                     for c in range(image.shape[2])], axis=-1)
+
+
 def resize(image, output_shape, order=1, mode='constant', cval=0, clip=True,
-           preserve_range=False, anti_aliasing=False, anti_aliasing_sigma=None):
+           preserve_range=False, anti_aliasing=False, anti_aliasing_sigma=None,
+           backend=None):
     """A wrapper for Scikit-Image resize().
 
     Scikit-Image generates warnings on every call to resize() if it doesn't
     receive the right parameters. The right parameters depend on the version
     of skimage. This solves the problem by using different parameters per
     version. And it provides a central place to control resizing defaults.
+
+    backend: "opencv", "pil", "skimage" or "auto" (see
+        resolve_resize_backend()). OpenCV and Pillow skip Scikit-Image's
+        conversion to float64 and are several times faster. They handle
+        nearest-neighbor and bilinear resizing (order 0 or 1) without
+        anti-aliasing of:
+        - uint8 images with preserve_range=True, returned as uint8 (rounded
+          instead of truncated)
+        - float and bool masks, returned as float32
+        Other calls use Scikit-Image whatever the backend. OpenCV
+        replicates the border pixels rather than blending them with `cval`.
     """
+    backend = resolve_resize_backend(backend)
+    if backend != "skimage" and order in (0, 1) and not anti_aliasing:
+        resize_fn = _resize_opencv if backend == "opencv" else _resize_pil
+        if image.dtype == np.uint8 and preserve_range:
+            return resize_fn(image, output_shape, order)
+        if image.dtype == np.bool_ or np.issubdtype(image.dtype, np.floating):
+            return resize_fn(image.astype(np.float32), output_shape, order)
+
     if LooseVersion(skimage.__version__) >= LooseVersion("0.14"):
         # New in 0.14: anti_aliasing. Default it to False for backward
         # compatibility with skimage 0.13.
@@ -77,6 +77,7 @@ def print_banner():
 ║  API Endpoints:                                              ║
 ║    POST /predict        - AI Floor Plan Analysis            ║
 ║    GET  /health         - Server Health Check               ║
+║    GET  /ready          - Model Loaded & Warmed Up          ║
 ║    GET  /metrics        - Performance Metrics               ║
 ║    POST /               - Legacy Endpoint                   ║
 ╠══════════════════════════════════════════════════════════════╣
@@ -92,9 +93,11 @@ def main():
         print_banner()
         
         # Import the Flask app
-        from app import app, logger
+        from app import app, logger, initialize_worker
         
         logger.info("Loading ML model and initializing server...")
+        if not initialize_worker():
+            logger.error("Failed to load model during initialization")
         
         # Get core configuration with smart defaults
         flask_env = os.getenv('FLASK_ENV', 'production')
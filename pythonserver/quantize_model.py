@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+FloorPlanTo3D Quantized Graph Export
+Quantizes the frozen graphs written by export_model.py for CPU inference
+and reports their accuracy against the float graphs.
+
+int8 mode uses TensorFlow's eight-bit graph transforms: weights are stored
+as 8 bit, the convolutions, matmuls, bias adds, ReLUs and pools of the
+backbone and heads run as quantized ops, and the activation ranges between
+them are calibrated on a folder of representative floor plans. Adds, muls
+and concats stay float, so box decoding keeps its precision. weights mode
+only stores the weights as 8 bit, which shrinks the file but computes in
+float.
+
+The report runs both graphs on the evaluation images and scores the
+quantized detections against the float ones with box AP@0.5
+(utils.compute_ap), next to the forward pass times. Serve the result
+with FROZEN_GRAPH_DIR pointed at the output directory (with
+MODEL_VARIANTS, quantize each variant with --variant).
+"""
+
+import os
+# tf.Print output (the calibration ranges) is logged at INFO level
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '0'
+
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import numpy
+from PIL import Image
+from tensorflow.tools.graph_transforms import TransformGraph
+
+from app import (AppConfig, decode_image, decode_target_dim, frozen_graph_path, make_prediction_config,
+                 model_registry)
+from mrcnn import utils
+from mrcnn.model import FrozenMaskRCNN
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp', '.tif', '.tiff')
+
+QUANTIZE_TRANSFORMS = {
+    'weights': ['quantize_weights'],
+    'int8': ['quantize_weights',
+             'quantize_nodes(ignore_op=Add, ignore_op=Mul, ignore_op=Concat)'],
+}
+
+
+def load_images(directory, max_images, variant):
+    """Decode the images of a folder the way /predict does for a variant"""
+    paths = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                   if name.lower().endswith(IMAGE_EXTENSIONS))[:max_images]
+    if not paths:
+        raise SystemExit(f"No images found in {directory}")
+    return [(os.path.basename(path), decode_image(Image.open(path), decode_target_dim(variant))[0])
+            for path in paths]
+
+
+def read_graph(path):
+    with open(os.path.splitext(path)[0] + '.json') as f:
+        metadata = json.load(f)
+    graph_def = FrozenMaskRCNN.read_graph_def(path)
+    return graph_def, metadata
+
+
+def write_graph(graph_def, metadata, path):
+    with open(path, 'wb') as f:
+        f.write(graph_def.SerializeToString())
+    with open(os.path.splitext(path)[0] + '.json', 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+
+def node_names(tensor_names):
+    return [name.split(':')[0] for name in tensor_names if name]
+
+
+@contextmanager
+def capture_stderr(path):
+    """Send everything written to file descriptor 2, including TensorFlow's
+    C++ logging, to path"""
+    sys.stderr.flush()
+    saved = os.dup(2)
+    with open(path, 'ab') as f:
+        os.dup2(f.fileno(), 2)
+        try:
+            yield
+        finally:
+            sys.stderr.flush()
+            os.dup2(saved, 2)
+            os.close(saved)
+
+
+def detect(model, image):
+    """Detections and forward pass seconds for one image"""
+    timings = {}
+    result = model.detect([image] * model.config.BATCH_SIZE, timings=timings)[0]
+    return result, timings['predict']
+
+
+def quantize(graph_def, metadata, mode, variant, batch_size, calibration_images, work_dir):
+    """Returns the quantized GraphDef for one batch size"""
+    inputs = node_names(metadata['inputs'] + [metadata['learning_phase']])
+    outputs = node_names(metadata['outputs'])
+    quantized = TransformGraph(graph_def, inputs, outputs,
+                               ['add_default_attributes', 'fold_constants(ignore_errors=true)',
+                                'fold_batch_norms', 'fold_old_batch_norms']
+                               + QUANTIZE_TRANSFORMS[mode])
+    if mode != 'int8':
+        return quantized
+
+    # Log the range of every requantization while running the calibration
+    # images, then bake those ranges into the graph as constants
+    logged = TransformGraph(quantized, inputs, outputs,
+                            ['insert_logging(op=RequantizationRange, show_name=true, '
+                             'message="__requant_min_max:")'])
+    logged_path = os.path.join(work_dir, f"logged_b{batch_size}.pb")
+    write_graph(logged, metadata, logged_path)
+    model = FrozenMaskRCNN(make_prediction_config(batch_size, variant), logged_path)
+    log_path = os.path.join(work_dir, f"ranges_b{batch_size}.log")
+    with capture_stderr(log_path):
+        for _, image in calibration_images:
+            detect(model, image)
+    model.session.close()
+    # Without the ranges freeze_requantization_ranges fails or bakes in
+    # garbage, e.g. when TF_CPP_MIN_LOG_LEVEL hid the INFO level tf.Print logs
+    with open(log_path, errors='replace') as f:
+        if not any('__requant_min_max:' in line for line in f):
+            raise SystemExit(f"No requantization ranges were logged to {log_path}; "
+                             f"TensorFlow INFO logging must be enabled (TF_CPP_MIN_LOG_LEVEL=0)")
+
+    return TransformGraph(quantized, inputs, outputs,
+                          [f'freeze_requantization_ranges(min_max_log_file="{log_path}")',
+                           'sort_by_execution_order'])
+
+
+def box_ap(reference, result):
+    """AP@0.5 of result's boxes, with the reference detections as ground truth"""
+    if len(reference['rois']) == 0:
+        return 1.0 if len(result['rois']) == 0 else 0.0
+    if len(result['rois']) == 0:
+        return 0.0
+    ap, _, _, _ = utils.compute_ap(reference['rois'], reference['class_ids'], None,
+                                   result['rois'], result['class_ids'], result['scores'], None)
+    return float(ap)
+
+
+def evaluate(float_path, quantized_path, variant, batch_size, images):
+    """Per-image box AP and forward pass times of the quantized graph
+    against the float one"""
+    float_model = FrozenMaskRCNN(make_prediction_config(batch_size, variant), float_path)
+    quantized_model = FrozenMaskRCNN(make_prediction_config(batch_size, variant), quantized_path)
+    # The first run of each input shape includes one-time setup
+    for image in {image.shape: image for _, image in images}.values():
+        detect(float_model, image)
+        detect(quantized_model, image)
+
+    rows = []
+    for name, image in images:
+        reference, float_seconds = detect(float_model, image)
+        result, quantized_seconds = detect(quantized_model, image)
+        rows.append({
+            'image': name,
+            'ap50': box_ap(reference, result),
+            'float_detections': len(reference['rois']),
+            'quantized_detections': len(result['rois']),
+            'float_ms': round(float_seconds * 1000, 1),
+            'quantized_ms': round(quantized_seconds * 1000, 1),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Quantize the frozen inference graphs')
+    parser.add_argument('calibration_dir', help='Folder of representative floor plans')
+    parser.add_argument('--eval-dir', help='Folder of floor plans for the accuracy report '
+                                           '(default: the calibration folder)')
+    parser.add_argument('--variant', choices=list(model_registry.variants),
+                        default=model_registry.default_name, help='Model variant (see MODEL_VARIANTS)')
+    parser.add_argument('--frozen-dir', help="Graphs written by export_model.py (default: the "
+                                             "variant's directory in FROZEN_GRAPH_DIR)")
+    parser.add_argument('--output-dir', help="Default: the variant's directory in ./weights/quantized")
+    parser.add_argument('--mode', choices=sorted(QUANTIZE_TRANSFORMS), default='int8')
+    parser.add_argument('--batch-sizes', default=','.join(str(size) for size in AppConfig.BATCH_SIZES))
+    parser.add_argument('--max-images', type=int, default=50, help='Per folder')
+    args = parser.parse_args()
+
+    variant = model_registry.variants[args.variant]
+    # Named variants are served from their own subdirectory
+    subdirectory = variant.name if AppConfig.MODEL_VARIANTS else ''
+    args.frozen_dir = args.frozen_dir or os.path.join(AppConfig.FROZEN_GRAPH_DIR or './weights/frozen',
+                                                      subdirectory)
+    args.output_dir = args.output_dir or os.path.join('./weights/quantized', subdirectory)
+
+    batch_sizes = sorted({int(size) for size in args.batch_sizes.split(',')})
+    calibration_images = load_images(args.calibration_dir, args.max_images, variant)
+    eval_images = load_images(args.eval_dir, args.max_images, variant) if args.eval_dir else calibration_images
+    if not args.eval_dir:
+        print("Warning: evaluating on the calibration images; pass --eval-dir for held-out plans")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix='quantize_')
+    try:
+        for batch_size in batch_sizes:
+            start_time = time.time()
+            float_path = frozen_graph_path(batch_size, args.frozen_dir)
+            graph_def, metadata = read_graph(float_path)
+            quantized = quantize(graph_def, metadata, args.mode, variant, batch_size,
+                                 calibration_images, work_dir)
+            metadata = dict(metadata, quantization=args.mode,
+                            calibration_images=len(calibration_images) if args.mode == 'int8' else 0)
+            path = frozen_graph_path(batch_size, args.output_dir)
+            write_graph(quantized, metadata, path)
+            print(f"Batch size {batch_size}: {path} ({os.path.getsize(path) / 1024 / 1024:.1f} MB, "
+                  f"float {os.path.getsize(float_path) / 1024 / 1024:.1f} MB) "
+                  f"in {time.time() - start_time:.1f}s")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    batch_size = batch_sizes[0]
+    rows = evaluate(frozen_graph_path(batch_size, args.frozen_dir),
+                    frozen_graph_path(batch_size, args.output_dir), variant, batch_size, eval_images)
+    summary = {
+        'variant': variant.name,
+        'mode': args.mode,
+        'batch_size': batch_size,
+        'images': len(rows),
+        'box_map50': round(float(numpy.mean([row['ap50'] for row in rows])), 4),
+        'float_ms_mean': round(float(numpy.mean([row['float_ms'] for row in rows])), 1),
+        'quantized_ms_mean': round(float(numpy.mean([row['quantized_ms'] for row in rows])), 1),
+    }
+    summary['speedup'] = round(summary['float_ms_mean'] / summary['quantized_ms_mean'], 2)
+
+    print(f"\n{'image':32} {'AP50':>6} {'float':>6} {'quant':>6} {'float ms':>9} {'quant ms':>9}")
+    for row in rows:
+        print(f"{row['image'][:32]:32} {row['ap50']:6.3f} {row['float_detections']:6d} "
+              f"{row['quantized_detections']:6d} {row['float_ms']:9.1f} {row['quantized_ms']:9.1f}")
+    print(f"\nBox mAP@0.5 vs float: {summary['box_map50']:.4f} over {summary['images']} images")
+    print(f"Forward pass: {summary['float_ms_mean']:.1f} ms float, "
+          f"{summary['quantized_ms_mean']:.1f} ms {args.mode} ({summary['speedup']:.2f}x)")
+
+    report_path = os.path.join(args.output_dir, 'quantization_report.json')
+    with open(report_path, 'w') as f:
+        json.dump({'summary': summary, 'images': rows}, f, indent=2)
+    serve_dir = os.path.dirname(os.path.normpath(args.output_dir)) if subdirectory else args.output_dir
+    print(f"Report written to {report_path}. Serve with FROZEN_GRAPH_DIR={serve_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+fold_batch_norms() must give a conv-only model the same outputs as the
+conv + frozen BatchNorm model it was folded from.
+"""
+
+import numpy
+import pytest
+
+pytest.importorskip("tensorflow")
+import keras
+import keras.layers as KL
+
+from mrcnn.model import BatchNorm, fold_batch_norms, folded_conv_name
+
+# (conv name, BatchNorm name) pairs named like the backbone and the heads
+LAYER_NAMES = [
+    ("conv1", "bn_conv1"),
+    ("res2a_branch2a", "bn2a_branch2a"),
+    ("mrcnn_class_conv1", "mrcnn_class_bn1"),
+]
+
+
+def build_model(with_batch_norm):
+    inputs = KL.Input(shape=(16, 16, 3))
+    x = inputs
+    for conv_name, bn_name in LAYER_NAMES:
+        x = KL.Conv2D(8, (3, 3), padding="same", name=conv_name)(x)
+        if with_batch_norm:
+            # Default epsilon, as in resnet_graph() and the heads
+            x = BatchNorm(name=bn_name)(x, training=False)
+        x = KL.Activation("relu")(x)
+    return keras.models.Model(inputs, x)
+
+
+def randomize_weights(model, rng):
+    for layer in model.layers:
+        if isinstance(layer, KL.Conv2D):
+            kernel, bias = layer.get_weights()
+            layer.set_weights([rng.normal(0, 0.3, kernel.shape).astype(numpy.float32),
+                               rng.normal(0, 0.1, bias.shape).astype(numpy.float32)])
+        elif isinstance(layer, BatchNorm):
+            shape = layer.get_weights()[0].shape
+            layer.set_weights([rng.uniform(0.5, 1.5, shape).astype(numpy.float32),   # gamma
+                               rng.normal(0, 0.2, shape).astype(numpy.float32),      # beta
+                               rng.normal(0, 0.5, shape).astype(numpy.float32),      # moving mean
+                               rng.uniform(0.01, 2.0, shape).astype(numpy.float32)])  # moving variance
+
+
+def weights_by_name(model):
+    return {layer.name: layer.get_weights() for layer in model.layers if layer.get_weights()}
+
+
+def test_folded_conv_name():
+    for conv_name, bn_name in LAYER_NAMES:
+        assert folded_conv_name(bn_name) == conv_name
+
+
+def test_folded_model_matches_batch_norm_model():
+    keras.backend.clear_session()
+    rng = numpy.random.RandomState(0)
+    reference = build_model(with_batch_norm=True)
+    randomize_weights(reference, rng)
+
+    folded = fold_batch_norms(weights_by_name(reference))
+    assert not any(bn_name in folded for _, bn_name in LAYER_NAMES)
+
+    model = build_model(with_batch_norm=False)
+    for layer in model.layers:
+        if layer.name in folded:
+            layer.set_weights(folded[layer.name])
+
+    images = rng.uniform(-1, 1, (4, 16, 16, 3)).astype(numpy.float32)
+    expected = reference.predict(images)
+    assert numpy.allclose(model.predict(images), expected, rtol=1e-4, atol=1e-4)
+
+
+def test_folding_twice_is_a_no_op():
+    keras.backend.clear_session()
+    reference = build_model(with_batch_norm=True)
+    randomize_weights(reference, numpy.random.RandomState(1))
+
+    folded = fold_batch_norms(weights_by_name(reference))
+    refolded = fold_batch_norms(folded)
+    assert sorted(refolded) == sorted(folded)
+    for name, values in folded.items():
+        for value, refolded_value in zip(values, refolded[name]):
+            assert numpy.array_equal(value, refolded_value)
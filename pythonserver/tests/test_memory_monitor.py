@@ -0,0 +1,47 @@
+"""
+A MemoryMonitor created before fork (the Gunicorn master, with preload_app)
+must sample the worker's own process once it runs in the worker.
+"""
+
+import json
+import os
+
+import pytest
+
+pytest.importorskip("psutil")
+pytest.importorskip("tensorflow")
+
+from app import MemoryMonitor
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_forked_worker_samples_its_own_process():
+    monitor = MemoryMonitor(interval=60, history_size=10, worker_interval=3600)
+    assert monitor.latest()["pid"] == os.getpid()
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # Worker: report what the inherited monitor samples, then exit
+        # without running the parent's pytest teardown
+        try:
+            os.close(read_fd)
+            sample = monitor.latest()
+            report = {
+                "pid": os.getpid(),
+                "sampled_pid": sample["pid"],
+                "process_pid": monitor.process.pid,
+                "history_pids": [entry["pid"] for entry in monitor.get_history()],
+            }
+            os.write(write_fd, json.dumps(report).encode())
+        finally:
+            os._exit(0)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd, "rb") as reader:
+        report = json.loads(reader.read().decode())
+    os.waitpid(pid, 0)
+
+    assert report["sampled_pid"] == report["pid"]
+    assert report["process_pid"] == report["pid"]
+    assert set(report["history_pids"]) <= {report["pid"]}
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+BatchNorm Folding Check
+Builds the inference model with and without FOLD_BATCH_NORM, loads the
+same weights into both, and checks that they return the same detections
+on a folder of floor plans, up to float rounding. Also reports the forward
+pass time of each. Exits non-zero on a mismatch.
+"""
+
+import argparse
+import os
+import time
+
+import numpy
+from PIL import Image
+
+from app import decode_image, decode_target_dim, make_prediction_config, model_registry
+from mrcnn.model import MaskRCNN
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp', '.tif', '.tiff')
+
+
+def build_model(weights_path, variant, fold):
+    config = make_prediction_config(1, variant)
+    config.FOLD_BATCH_NORM = fold
+    model = MaskRCNN(mode='inference', model_dir=os.path.abspath('./mrcnn'), config=config)
+    model.load_weights(weights_path, by_name=True)
+    return model
+
+
+def detect(model, image):
+    timings = {}
+    result = model.detect([image], timings=timings)[0]
+    return result, timings['predict']
+
+
+def compare(reference, result, box_tolerance, score_tolerance):
+    """Returns a description of the first difference, or None"""
+    if len(reference['rois']) != len(result['rois']):
+        return f"{len(reference['rois'])} vs {len(result['rois'])} detections"
+    if not numpy.array_equal(reference['class_ids'], result['class_ids']):
+        return "different class ids"
+    if len(reference['rois']) == 0:
+        return None
+    box_diff = numpy.abs(reference['rois'] - result['rois']).max()
+    score_diff = numpy.abs(reference['scores'] - result['scores']).max()
+    if box_diff > box_tolerance or score_diff > score_tolerance:
+        return f"boxes differ by {box_diff} px, scores by {score_diff:.2e}"
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that FOLD_BATCH_NORM keeps detections unchanged')
+    parser.add_argument('image_dir', help='Folder of floor plans')
+    parser.add_argument('--variant', choices=list(model_registry.variants),
+                        default=model_registry.default_name, help='Model variant (see MODEL_VARIANTS)')
+    parser.add_argument('--weights', help="Default: the variant's weights file")
+    parser.add_argument('--max-images', type=int, default=20)
+    parser.add_argument('--box-tolerance', type=int, default=1, help='Pixels')
+    parser.add_argument('--score-tolerance', type=float, default=1e-3)
+    args = parser.parse_args()
+    variant = model_registry.variants[args.variant]
+    weights_path = args.weights or variant.weights_path
+
+    paths = sorted(os.path.join(args.image_dir, name) for name in os.listdir(args.image_dir)
+                   if name.lower().endswith(IMAGE_EXTENSIONS))[:args.max_images]
+    if not paths:
+        raise SystemExit(f"No images found in {args.image_dir}")
+
+    start_time = time.time()
+    reference_model = build_model(weights_path, variant, fold=False)
+    print(f"Built and loaded the unfolded model in {time.time() - start_time:.1f}s "
+          f"({len(reference_model.keras_model.layers)} layers)")
+    start_time = time.time()
+    folded_model = build_model(weights_path, variant, fold=True)
+    print(f"Built and loaded the folded model in {time.time() - start_time:.1f}s "
+          f"({len(folded_model.keras_model.layers)} layers)")
+
+    mismatches = 0
+    reference_seconds, folded_seconds = [], []
+    for index, path in enumerate(paths):
+        image = decode_image(Image.open(path), decode_target_dim(variant))[0]
+        reference, reference_time = detect(reference_model, image)
+        result, folded_time = detect(folded_model, image)
+        if index > 0:
+            # The first call includes one-time setup
+            reference_seconds.append(reference_time)
+            folded_seconds.append(folded_time)
+        difference = compare(reference, result, args.box_tolerance, args.score_tolerance)
+        mismatches += difference is not None
+        print(f"{os.path.basename(path)[:40]:40} {len(reference['rois']):3d} detections  "
+              f"{difference or 'OK'}")
+
+    if reference_seconds:
+        print(f"\nForward pass: {numpy.mean(reference_seconds) * 1000:.1f} ms unfolded, "
+              f"{numpy.mean(folded_seconds) * 1000:.1f} ms folded")
+    print(f"{len(paths) - mismatches}/{len(paths)} images with equivalent detections")
+    raise SystemExit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()